@@ -1,16 +1,73 @@
+import argparse
 import duckdb
-import pandas as pd
-import pandasql as psql
-import gc
+import fnmatch
+import glob
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import re
+import resource
+import shutil
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime
 
 # Files paths.
 RAW_PATH = 'raw/'
 SILVER_PATH = 'silver/'
+GOLD_PATH = 'gold/'
+LOG_PATH = 'logs/'
+CACHE_PATH = 'raw/.cache/'
+CACHE_RELATORIOS_PATH = 'gold/.relatorios/'
 
-# Definition of states for analysis according to the IBGE code
-CODIGO_IBGE_SIH = "330455,530010,355030"
+# Size of the report cache, least recently used results are removed above it.
+TAMANHO_CACHE_RELATORIOS = 256 * 1024 * 1024
 
-CODIGO_IBGE = "3304557,5300108,3550308"
+# Base URL of the Fiocruz archives, replaceable (--url-base) by a mirror or a local server.
+URL_BASE = 'https://bigdata-arquivos.icict.fiocruz.br/PUBLICO/'
+
+"""
+
+Archives downloaded by the acquisition stages (see adquirir_fonte).
+
+    fonte: (path of the .zip under URL_BASE, directory of the raw layer, pattern of the .csv members to extract)
+
+"""
+FONTES = {
+    "etlsih": ("SIH/ETLSIH.zip", "ETLSIH/", "ETLSIH.ST_*_t.csv"),
+    "acidentes": ("SIMU/temas/simu-acidentes-transportes-mun-T.zip", "SIMU - Acidentes de Transportes/", "*.csv"),
+    "carteira": ("SIMU/bases_dados/CARTEIRA/simu-carteira-mun-T.zip", "", "*.csv"),
+    "frota": ("SIMU/bases_dados/FROTA/simu-frota-mun_T.zip", "", "*.csv"),
+}
+
+# Concurrent range requests per download, each one of at least TAMANHO_MINIMO_PARTE bytes.
+PARTES_DOWNLOAD = 8
+TAMANHO_MINIMO_PARTE = 16 * 1024 * 1024
+TAMANHO_BLOCO = 1024 * 1024
+
+# Guards the index of the download cache, written by the acquisition stages in parallel.
+TRAVA_CACHE = threading.Lock()
+
+# Definition of municipalities for analysis according to the IBGE code (7 digits).
+# The SIH code (6 digits) is the IBGE code without the check digit.
+MUNICIPIOS_IBGE = [3304557, 5300108, 3550308]
+
+# IBGE code of each brazilian state, the first two digits of the municipality code.
+CODIGOS_UF = {
+    "RO": 11, "AC": 12, "AM": 13, "RR": 14, "PA": 15, "AP": 16, "TO": 17,
+    "MA": 21, "PI": 22, "CE": 23, "RN": 24, "PB": 25, "PE": 26, "AL": 27, "SE": 28, "BA": 29,
+    "MG": 31, "ES": 32, "RJ": 33, "SP": 35,
+    "PR": 41, "SC": 42, "RS": 43,
+    "MS": 50, "MT": 51, "GO": 52, "DF": 53,
+}
 
 # List with all brazilian states for analyze. In this analyzes we'll be analyze this big three states.
 ESTADOS_BRASILEIROS = [
@@ -43,472 +100,2716 @@ ESTADOS_BRASILEIROS = [
     # 'TO'   # Tocantins
 ]
 
+# IPEA series (file name without .csv) and the column of each one after the pivot.
+SERIES_IPEA = {
+    "bitos-em-acidentes-de-transporte": "valor",
+    "bitos-em-acidentes-de-transporte-mulheres": "total_mulheres",
+    "bitos-em-acidentes-de-transporte-homens": "total_homens",
+    "bitos-em-acidentes-de-transporte-de-jovens": "total_jovens",
+    "bitos-em-acidentes-de-transporte-de-jovens-homens": "total_jovens_homens",
+    "bitos-em-acidentes-de-transporte-de-jovens-mulheres": "total_jovens_mulheres",
+    "taxa-de-obitos-em-acidentes-de-transporte": "taxa_transporte",
+    "taxa-de-obitos-em-acidentes-de-transporte-mulheres": "taxa_mulheres",
+    "taxa-de-obitos-em-acidentes-de-transporte-homens": "taxa_homens",
+    "taxa-de-obitos-em-acidentes-de-transporte-de-jovens": "taxa_jovens",
+    "taxa-de-obitos-em-acidentes-de-transporte-de-jovens-homens": "taxa_jovens_homens",
+    "taxa-de-obitos-em-acidentes-de-transporte-de-jovens-mulheres": "taxa_jovens_mulheres",
+}
+
+# Main IPEA series, the other ones are joined to it.
+SERIE_IPEA_PRINCIPAL = "bitos-em-acidentes-de-transporte"
+
 # Initial param
 ANO_INICIAL = 2015
 ANO_FINAL = 2021
 
-def ler_acidentes_IPEA(conn) -> pd.DataFrame:
+# Memory limit of duckdb, queries above it spill to disk instead of failing.
+LIMITE_MEMORIA = "2GB"
+
+# Years of the IPEA series, which start before the SIH data.
+ANO_INICIAL_IPEA = 2010
+ANO_FINAL_IPEA = 2020
+
+# Number of states ingested in parallel.
+NUMERO_THREADS = os.cpu_count() or 1
+
+# Number of worker processes of the national mode (see ler_etlsih_nacional).
+NUMERO_PROCESSOS = os.cpu_count() or 1
+
+# Interval in seconds between the RSS samples of a pipeline stage (see executar_etapa).
+INTERVALO_RSS = 0.05
+
+# Lock of the ETLSIH manifest, updated by the states ingested in parallel.
+TRAVA_MANIFESTO = threading.Lock()
+
+# Number of rows per row group of the ETLSIH .parquet files.
+TAMANHO_ROW_GROUP = 122880
+
+# Compression of the ETLSIH .parquet files. duckdb writes the narrow integers PLAIN encoded,
+# which SNAPPY barely shrinks: with ZSTD the files are about 40% smaller.
+COMPRESSAO_SIH = "ZSTD"
+
+# Values of ETLSIH files summarised in the gold layer.
+VALORES_SIH = ["VAL_TOT", "VAL_UTI", "VAL_SH", "VAL_SP"]
+
+# Schema of the ETLSIH silver layer: fields of ETLSIH files that we need and their types.
+# Codes, years and months are narrow integers, values are decimals with cents,
+# and the labels (def_* and int_* text fields) stay text: the parquet writer stores them dictionary encoded,
+# but duckdb still compares them as strings.
+ESQUEMA_SIH = {
+    "int_MUNCOD": "INTEGER",
+    "int_MUNNOME": "VARCHAR",
+    "ANO_CMPT": "SMALLINT",
+    "MES_CMPT": "TINYINT",
+    "def_sexo": "VARCHAR",
+    "VAL_SH": "DECIMAL(12,2)",
+    "VAL_SP": "DECIMAL(12,2)",
+    "VAL_TOT": "DECIMAL(12,2)",
+    "VAL_UTI": "DECIMAL(12,2)",
+    "DIAG_PRINC": "VARCHAR",
+    "IDADE": "SMALLINT",
+    "RACA_COR": "VARCHAR",
+    "int_CAPITAL": "VARCHAR",
+    "int_SIGLA_UF": "VARCHAR",
+    "int_CODIGO_UF": "TINYINT",
+    "int_REGIAO": "VARCHAR",
+    "int_NOME_UF": "VARCHAR",
+    "dia_semana_internacao": "VARCHAR",
+    "ano_internacao": "SMALLINT",
+    "mes_internacao": "TINYINT",
+    "def_procedimento_realizado": "VARCHAR",
+    "def_procedimento_solicitado": "VARCHAR",
+    "def_leitos": "VARCHAR",
+    "def_car_int": "VARCHAR",
+    "def_cobranca": "VARCHAR",
+    "def_morte": "VARCHAR",
+    "def_raca_cor": "VARCHAR",
+    "def_idade_pub": "VARCHAR",
+    "DIAGSEC1": "VARCHAR",
+}
+
+# Version of ESQUEMA_SIH, partitions written with another version are ingested again.
+VERSAO_ESQUEMA_SIH = 3
+
+def codigo_cid10(codigo) -> int:
+    # ICD-10 category as an integer: index of the letter (A = 0) * 100 + number, e.g. V01 = 2101.
+    return (ord(codigo[0].upper()) - ord("A")) * 100 + int(codigo[1:3])
+
+# ICD-10 chapters: (first category, last category, name).
+CAPITULOS_CID10 = [
+    ("A00", "B99", "I. Algumas doenças infecciosas e parasitárias"),
+    ("C00", "D48", "II. Neoplasias (tumores)"),
+    ("D50", "D89", "III. Doenças sangue órgãos hemat e transt imunitár"),
+    ("E00", "E90", "IV. Doenças endócrinas nutricionais e metabólicas"),
+    ("F00", "F99", "V. Transtornos mentais e comportamentais"),
+    ("G00", "G99", "VI. Doenças do sistema nervoso"),
+    ("H00", "H59", "VII. Doenças do olho e anexos"),
+    ("H60", "H95", "VIII. Doenças do ouvido e da apófise mastóide"),
+    ("I00", "I99", "IX. Doenças do aparelho circulatório"),
+    ("J00", "J99", "X. Doenças do aparelho respiratório"),
+    ("K00", "K93", "XI. Doenças do aparelho digestivo"),
+    ("L00", "L99", "XII. Doenças da pele e do tecido subcutâneo"),
+    ("M00", "M99", "XIII. Doenças sist osteomuscular e tec conjuntivo"),
+    ("N00", "N99", "XIV. Doenças do aparelho geniturinário"),
+    ("O00", "O99", "XV. Gravidez parto e puerpério"),
+    ("P00", "P96", "XVI. Algumas afec originadas no período perinatal"),
+    ("Q00", "Q99", "XVII. Malf cong deformid e anomalias cromossômicas"),
+    ("R00", "R99", "XVIII. Sint sinais e achad anorm ex clín e laborat"),
+    ("S00", "T98", "XIX. Lesões enven e alg out conseq causas externas"),
+    ("V01", "Y98", "XX. Causas externas de morbidade e mortalidade"),
+    ("Z00", "Z99", "XXI. Contatos com serviços de saúde"),
+    ("U00", "U99", "XXII. Códigos para propósitos especiais"),
+]
+
+# Groups of the external causes (chapter XX): (first category, last category, name).
+GRUPOS_CAUSAS_EXTERNAS = [
+    ("V01", "V09", "Pedestre traumatizado em acidente de transporte"),
+    ("V10", "V19", "Ciclista traumatizado em acidente de transporte"),
+    ("V20", "V29", "Motociclista traumatizado em acidente de transporte"),
+    ("V30", "V39", "Ocupante de triciclo motorizado traumatizado em acidente de transporte"),
+    ("V40", "V49", "Ocupante de automóvel traumatizado em acidente de transporte"),
+    ("V50", "V59", "Ocupante de caminhonete traumatizado em acidente de transporte"),
+    ("V60", "V69", "Ocupante de veículo de transporte pesado traumatizado em acidente de transporte"),
+    ("V70", "V79", "Ocupante de ônibus traumatizado em acidente de transporte"),
+    ("V80", "V89", "Outros acidentes de transporte terrestre"),
+    ("V90", "V94", "Acidentes de transporte por água"),
+    ("V95", "V97", "Acidentes de transporte aéreo e espacial"),
+    ("V98", "V99", "Outros acidentes de transporte e os não especificados"),
+    ("W00", "W19", "Quedas"),
+    ("W20", "W49", "Exposição a forças mecânicas inanimadas"),
+    ("W50", "W64", "Exposição a forças mecânicas animadas"),
+    ("W65", "W74", "Afogamento e submersão acidentais"),
+    ("W75", "W84", "Outros riscos acidentais à respiração"),
+    ("W85", "W99", "Exposição a corrente elétrica, radiação e temperaturas e pressões extremas"),
+    ("X00", "X09", "Exposição à fumaça, ao fogo e às chamas"),
+    ("X10", "X19", "Contato com fonte de calor ou substâncias quentes"),
+    ("X20", "X29", "Contato com animais e plantas venenosos"),
+    ("X30", "X39", "Exposição às forças da natureza"),
+    ("X40", "X49", "Envenenamento acidental por exposição a substâncias nocivas"),
+    ("X50", "X57", "Excesso de esforços, viagens e privações"),
+    ("X58", "X59", "Exposição acidental a outros fatores e aos não especificados"),
+    ("X60", "X84", "Lesões autoprovocadas intencionalmente"),
+    ("X85", "Y09", "Agressões"),
+    ("Y10", "Y34", "Eventos cuja intenção é indeterminada"),
+    ("Y35", "Y36", "Intervenções legais e operações de guerra"),
+    ("Y40", "Y84", "Complicações de assistência médica e cirúrgica"),
+    ("Y85", "Y89", "Seqüelas de causas externas de morbidade e de mortalidade"),
+    ("Y90", "Y98", "Fatores suplementares relacionados com as causas de morbidade e de mortalidade"),
+]
+
+# Secondary diagnoses ingested (external causes, V01-Y98) and analyzed as traffic accidents (V01-V89).
+CID10_CAUSAS_EXTERNAS = (codigo_cid10("V01"), codigo_cid10("Y98"))
+CID10_TRANSITO = (codigo_cid10("V01"), codigo_cid10("V89"))
+
+@dataclass
+class Escopo:
     """
     [Description]
 
-        Reads traffic accident files by year and municipality, made available by IPEA.
-        Numbers and rates of deaths from traffic accidents in Brazil, by year, municipality, sex. 
-    
+        Scope of the analysis: states, municipalities and years.
+
     [Source]
 
-        Link: https://www.ipea.gov.br/atlasviolencia/filtros-series/12/violencia-no-transito
+        None
 
     [Goal]
 
-        Reading of all files aggregated by year and municipality, making them available in a dataframe,
-        seeking to obtain better performance in data analysis.
-    
+        Driving the filters of every reader from one place. The scope is registered in duckdb as the tables
+        escopo_uf and escopo_municipio (see registrar), and the readers filter through them (see filtro),
+        so the queries do not change with the number of municipalities.
+        Records must be in the states and, when municipalities are given, in the municipalities.
+        An empty list of municipalities selects every municipality of the states.
+
     """
-    
-    # Reading downloaded files using duckdb
-    df_transportes = conn.execute(f"""SELECT * FROM '{RAW_PATH}IPEA/bitos-em-acidentes-de-transporte.csv' WHERE cod in ('3304557','5300108','3550308')""").df()
-    df_mulheres = conn.execute(f"""SELECT * FROM '{RAW_PATH}IPEA/bitos-em-acidentes-de-transporte-mulheres.csv' WHERE cod in ('3304557','5300108','3550308')""").df()
-    df_homens = conn.execute(f"""SELECT * FROM '{RAW_PATH}IPEA/bitos-em-acidentes-de-transporte-homens.csv' WHERE cod in ('3304557','5300108','3550308')""").df()
-    df_jovens = conn.execute(f"""SELECT * FROM '{RAW_PATH}IPEA/bitos-em-acidentes-de-transporte-de-jovens.csv' WHERE cod in ('3304557','5300108','3550308')""").df()
-    df_jovens_homens = conn.execute(f"""SELECT * FROM '{RAW_PATH}IPEA/bitos-em-acidentes-de-transporte-de-jovens-homens.csv' WHERE cod in ('3304557','5300108','3550308')""").df()
-    df_jovens_mulheres = conn.execute(f"SELECT * FROM '{RAW_PATH}IPEA/bitos-em-acidentes-de-transporte-de-jovens-mulheres.csv' WHERE cod in ('3304557','5300108','3550308')""").df()
-    df_tx_transportes = conn.execute(f"""SELECT * FROM '{RAW_PATH}IPEA/taxa-de-obitos-em-acidentes-de-transporte.csv' WHERE cod in ('3304557','5300108','3550308')""").df()
-    df_tx_mulheres = conn.execute(f"""SELECT * FROM '{RAW_PATH}IPEA/taxa-de-obitos-em-acidentes-de-transporte-mulheres.csv' WHERE cod in ('3304557','5300108','3550308')""").df()
-    df_tx_homens = conn.execute(f"""SELECT * FROM '{RAW_PATH}IPEA/taxa-de-obitos-em-acidentes-de-transporte-homens.csv' WHERE cod in ('3304557','5300108','3550308')""").df()
-    df_tx_jovens = conn.execute(f"""SELECT * FROM '{RAW_PATH}IPEA/taxa-de-obitos-em-acidentes-de-transporte-de-jovens.csv' WHERE cod in ('3304557','5300108','3550308')""").df()
-    df_tx_jovens_homens = conn.execute(f"""SELECT * FROM '{RAW_PATH}IPEA/taxa-de-obitos-em-acidentes-de-transporte-de-jovens-homens.csv' WHERE cod in ('3304557','5300108','3550308')""").df()
-    df_tx_jovens_mulheres = conn.execute(f"""SELECT * FROM '{RAW_PATH}IPEA/taxa-de-obitos-em-acidentes-de-transporte-de-jovens-mulheres.csv' WHERE cod in ('3304557','5300108','3550308')""").df()
-
-    # Query dataframes using to aggregate values ​​by month and year.
-    query = """
-        SELECT df_transportes.*, 
-        df_mulheres.valor as total_mulheres, 
-        df_homens.valor as total_homens, 
-        df_jovens.valor as total_jovens, 
-        df_jovens_homens.valor as total_jovens_homens, 
-        df_jovens_mulheres.valor as total_jovens_mulheres,
-        df_tx_transportes.valor as taxa_transporte,
-        df_tx_mulheres.valor as taxa_mulheres,
-        df_tx_homens.valor as taxa_homens,
-        df_tx_jovens.valor as taxa_jovens,
-        df_tx_jovens_homens.valor as taxa_jovens_homens,
-        df_tx_jovens_mulheres.valor as taxa_jovens_mulheres
-
-
-        FROM df_transportes
-        LEFT JOIN df_mulheres
-        ON df_transportes.cod = df_mulheres.cod AND df_transportes.período = df_mulheres.período
-        LEFT JOIN df_homens
-        ON df_transportes.cod = df_homens.cod AND df_transportes.período = df_homens.período
-        LEFT JOIN df_jovens
-        ON df_transportes.cod = df_jovens.cod AND df_transportes.período = df_jovens.período
-        LEFT JOIN df_jovens_homens
-        ON df_transportes.cod = df_jovens_homens.cod AND df_transportes.período = df_jovens_homens.período
-        LEFT JOIN df_jovens_mulheres
-        ON df_transportes.cod = df_jovens_mulheres.cod AND df_transportes.período = df_jovens_mulheres.período
-        LEFT JOIN df_tx_transportes
-        ON df_transportes.cod = df_tx_transportes.cod AND df_transportes.período = df_tx_transportes.período
-        LEFT JOIN df_tx_mulheres
-        ON df_transportes.cod = df_tx_mulheres.cod AND df_transportes.período = df_tx_mulheres.período
-        LEFT JOIN df_tx_homens
-        ON df_transportes.cod = df_tx_homens.cod AND df_transportes.período = df_tx_homens.período
-        LEFT JOIN df_tx_jovens
-        ON df_transportes.cod = df_tx_jovens.cod AND df_transportes.período = df_tx_jovens.período
-        LEFT JOIN df_tx_jovens_homens
-        ON df_transportes.cod = df_tx_jovens_homens.cod AND df_transportes.período = df_tx_jovens_homens.período
-        LEFT JOIN df_tx_jovens_mulheres
-        ON df_transportes.cod = df_tx_jovens_mulheres.cod AND df_transportes.período = df_tx_jovens_mulheres.período
-
-        where df_transportes.período in ('2010','2011','2012','2013','2014','2015','2016','2017','2018','2019','2020')
-    """
-
-    # Using pandasql to execute query
-    df_total = psql.sqldf(query, locals())
-
-    # Cleaning unused dataframe
-    del df_transportes
-    del df_mulheres
-    del df_homens
-    del df_jovens
-    del df_jovens_homens
-    del df_jovens_mulheres
-    del df_tx_transportes
-    del df_tx_mulheres
-    del df_tx_homens
-    del df_tx_jovens
-    del df_tx_jovens_homens
-    del df_tx_jovens_mulheres
-    
-    # Garbage collect
-    gc.collect()
-    
-    return df_total
 
-def ler_acidentes(conn) -> None:
+    ufs: list = field(default_factory=lambda: list(ESTADOS_BRASILEIROS))
+    municipios: list = field(default_factory=lambda: list(MUNICIPIOS_IBGE))
+    ano_inicial: int = ANO_INICIAL
+    ano_final: int = ANO_FINAL
+
+    @property
+    def municipios_sih(self) -> list:
+        # Removing the check digit of the IBGE code.
+        return [codigo // 10 for codigo in self.municipios]
+
+    def chave(self) -> str:
+        # Identifies the filter applied to the records, used to detect ingestions made with another scope.
+        return hashlib.sha256(json.dumps([sorted(self.ufs), sorted(self.municipios)]).encode()).hexdigest()[:16]
+
+    def carimbo(self) -> dict:
+        # Scope the outputs of a pipeline stage were written with (see etapa_atualizada).
+        return {"escopo": self.chave(), "ano_inicial": self.ano_inicial, "ano_final": self.ano_final}
+
+    def registrar(self, conn) -> None:
+        # Must run once on the main connection, before the readers (cursors share these tables).
+        conn.execute("CREATE OR REPLACE TABLE escopo_uf (sigla VARCHAR, codigo_uf INTEGER)")
+        conn.execute(
+            "INSERT INTO escopo_uf SELECT unnest(?::VARCHAR[]), unnest(?::INTEGER[])",
+            [self.ufs, [CODIGOS_UF[uf] for uf in self.ufs]],
+        )
+
+        conn.execute("CREATE OR REPLACE TABLE escopo_municipio (cod_ibge INTEGER, cod_sih INTEGER)")
+        conn.execute(
+            "INSERT INTO escopo_municipio SELECT unnest(?::INTEGER[]), unnest(?::INTEGER[])",
+            [self.municipios, self.municipios_sih],
+        )
+
+    def filtro(self, coluna, sih=False) -> str:
+        codigo = f"CAST({coluna} AS INTEGER)"
+
+        # State code (first two digits).
+        filtro_uf = f"{codigo} // {10000 if sih else 100000} IN (SELECT codigo_uf FROM escopo_uf)"
+
+        if self.municipios:
+            return f"{codigo} IN (SELECT {'cod_sih' if sih else 'cod_ibge'} FROM escopo_municipio) AND {filtro_uf}"
+
+        return filtro_uf
+
+def ler_escopo(argumentos) -> Escopo:
     """
     [Description]
 
-        Reads SIMU files - Transport Accidents.
-        Records with the fields necessary for the analysis.
-    
+        Builds the scope of the analysis from the command line.
+
     [Source]
 
-        Link: https://bigdata-arquivos.icict.fiocruz.br/PUBLICO/SIMU/temas/simu-acidentes-transportes-mun-T.zip
+        None
 
     [Goal]
 
-        Reading the .csv file through duckdb returning a dataframe.
-    
+        Reading the scope from a .json file (--escopo) with the keys ufs, municipios, ano_inicial and ano_final,
+        overridden by the options --ufs, --municipios, --ano-inicial and --ano-final.
+        The national mode (--nacional) starts from every municipality of every state.
+        States and municipalities must agree: without --ufs, the states are those of the municipalities given
+        with --municipios; without --municipios, the municipalities outside the states are dropped (every municipality
+        of the states when none is left). Municipalities given outside the states given raise a ValueError.
+
     """
-    x = conn.read_csv(f"""{RAW_PATH}SIMU - Acidentes de Transportes/Acidentes de Transportes.csv""")
 
-    df_simu_acidentes = conn.execute("""SELECT * FROM x WHERE "Código IBGE" in ('3304557','5300108','3550308') """).df()
+    escopo = Escopo()
 
-    # Rename column 'Código IBGE'
-    df_simu_acidentes.rename(columns={'Código IBGE': 'cod'}, inplace=True)
-    
-    # Reading IPEA accidents
-    df_ipea_acientes = ler_acidentes_IPEA(conn)
+    if argumentos.escopo:
+        with open(argumentos.escopo, encoding="utf-8") as arquivo:
+            escopo = Escopo(**json.load(arquivo))
 
-    # Rename column 'período'
-    df_ipea_acientes.rename(columns={'período': 'ano'}, inplace=True)
+        escopo.ufs = [uf.upper() for uf in escopo.ufs]
 
-    # Creating a new dataframe with merge between IPEA and SIMU data.
-    df_result = df_simu_acidentes.merge(df_ipea_acientes, on=['cod','ano'], how='inner')
+    if argumentos.nacional:
+        escopo.ufs = list(CODIGOS_UF)
+        escopo.municipios = []
 
-    # Creating .parquet file.
-    df_result.to_parquet(f"""{SILVER_PATH}acidentes-geral.parquet""", engine='pyarrow', compression='snappy')
- 
-def ler_carteira(conn) -> None:
+    if argumentos.ufs is not None:
+        escopo.ufs = list(argumentos.ufs)
+
+    if argumentos.municipios is not None:
+        escopo.municipios = argumentos.municipios
+
+    desconhecidas = [uf for uf in escopo.ufs if uf not in CODIGOS_UF]
+
+    if desconhecidas:
+        raise ValueError(f"unknown states: {' '.join(desconhecidas)}")
+
+    # State of each municipality, from the first two digits of the IBGE code.
+    siglas = {codigo: sigla for sigla, codigo in CODIGOS_UF.items()}
+
+    invalidos = [municipio for municipio in escopo.municipios if municipio // 100000 not in siglas]
+
+    if invalidos:
+        raise ValueError(f"invalid IBGE codes (7 digits): {' '.join(map(str, invalidos))}")
+
+    if argumentos.municipios and argumentos.ufs is None:
+        escopo.ufs = list(dict.fromkeys(siglas[municipio // 100000] for municipio in escopo.municipios))
+
+    fora = [municipio for municipio in escopo.municipios if siglas[municipio // 100000] not in escopo.ufs]
+
+    if fora and argumentos.municipios is not None:
+        raise ValueError(f"municipalities outside the states {' '.join(escopo.ufs)}: {' '.join(map(str, fora))}")
+
+    if fora:
+        escopo.municipios = [municipio for municipio in escopo.municipios if municipio not in fora]
+
+        if not escopo.municipios:
+            print(f"Scope: no municipality of the scope in {' '.join(escopo.ufs)}, using every municipality of the states")
+
+    sem_municipios = [
+        uf for uf in escopo.ufs
+        if escopo.municipios and uf not in {siglas[municipio // 100000] for municipio in escopo.municipios}
+    ]
+
+    if sem_municipios:
+        print(f"Warning: no municipality of the scope in {' '.join(sem_municipios)}, their records are all filtered out")
+
+    if argumentos.ano_inicial is not None:
+        escopo.ano_inicial = argumentos.ano_inicial
+
+    if argumentos.ano_final is not None:
+        escopo.ano_final = argumentos.ano_final
+
+    return escopo
+
+def configurar_conexao(conn, limite_memoria=LIMITE_MEMORIA, threads=NUMERO_THREADS) -> None:
     """
     [Description]
 
-        Reads the SIMU files - Enterprise Portfolio.
-        Records with the fields necessary for the analysis.
+        Configures the duckdb connection.
 
     [Source]
 
-        Link: https://bigdata-arquivos.icict.fiocruz.br/PUBLICO/SIMU/bases_dados/CARTEIRA/simu-carteira-mun-T.zip
+        None
 
     [Goal]
 
-        Reading the .csv file through duckdb returning a dataframe.
+        Capping the memory and threads used by duckdb. Exports stream from the .csv files to the .parquet files,
+        so memory does not depend on the input size, and anything above the limit spills to disk.
+
+    """
+
+    conn.execute(f"SET memory_limit = '{limite_memoria}'")
+
+    conn.execute(f"SET threads = {threads}")
 
+    conn.execute(f"SET temp_directory = '{SILVER_PATH}.tmp'")
 
+    # Rows of a query without ORDER BY may be written in any order, which lets exports stream.
+    conn.execute("SET preserve_insertion_order = false")
+
+def exportar_parquet(conn, query, destino) -> None:
     """
-    x = conn.read_csv(f"""{RAW_PATH}simu-carteira-mun-T.csv""")
+    [Description]
 
-    result = conn.execute(
-        f"""SELECT * FROM x WHERE "Código IBGE" in ({CODIGO_IBGE}) """
-    ).df()
+        Writes the result of a query to a .parquet file.
 
-    # Create .parquet file.
-    result.to_parquet(
-        f"""{SILVER_PATH}simu-carteira-mun-T.parquet""", engine="pyarrow", compression="snappy"
-    )
+    [Source]
+
+        None
+
+    [Goal]
+
+        Streaming the rows from duckdb to the .parquet file with COPY, without materialising them in pandas.
 
-    # Cleaning dataframe.
-    del result
+    """
 
-    # Garbage collect.
-    gc.collect()
+    conn.execute(f"""COPY ({query}) TO '{destino}' (FORMAT PARQUET, COMPRESSION SNAPPY)""")
 
-def ler_frotas(conn) -> None:
+def ler_indice_cache() -> dict:
     """
     [Description]
 
-        Reads SIMU files - Motorization - Evolutionary Fleet.
-        Records with the fields necessary for the analysis.
+        Reads the index of the download cache.
 
     [Source]
 
-        Link: https://bigdata-arquivos.icict.fiocruz.br/PUBLICO/SIMU/bases_dados/FROTA/simu-frota-mun_T.zip
+        None
 
     [Goal]
 
-        Reading the .csv file through duckdb returning a dataframe.
+        Returning, for each downloaded url, its ETag, size and the sha256 of its content (the name of the file in
+        CACHE_PATH/objetos), and for each extracted file, the .zip member it came from.
 
     """
-    x = conn.read_csv(f"""{RAW_PATH}simu-frota-mun_T.csv""")
 
-    result = conn.execute(
-        f"""SELECT * FROM x WHERE "Código IBGE" in ({CODIGO_IBGE}) """
-    ).df()
+    caminho = f"""{CACHE_PATH}indice.json"""
 
-    # Creating .parquet file.
-    result.to_parquet(
-        f"""{SILVER_PATH}simu-frota-mun_T.parquet""", engine="pyarrow", compression="snappy"
-    )
-    # Cleaning dataframe.
-    del result
+    if not os.path.exists(caminho):
+        return {"downloads": {}, "extracoes": {}}
 
-    # Garbage collect.
-    gc.collect()
+    with open(caminho, encoding="utf-8") as arquivo:
+        return json.load(arquivo)
 
-def ler_etlsih_file(conn):
+def atualizar_indice_cache(secao, chave, valor) -> None:
     """
     [Description]
 
-        Reads files from the SUS Hospital Information System - SIHSUS.
-        Records with the fields necessary for the analysis.
-    
+        Updates one entry of the index of the download cache.
+
     [Source]
 
-        Link: https://bigdata-arquivos.icict.fiocruz.br/PUBLICO/SIH/ETLSIH.zip
+        None
 
     [Goal]
 
-        Reading of all files aggregated by UF, making them available in a .parquet file,
-        seeking to obtain better performance in data analysis.
-    
+        Re-reading and writing the index under TRAVA_CACHE, through a temporary file, so parallel stages
+        and interrupted runs never lose or break entries.
+
     """
-    
-    # Definição das variáveis de apoio.
-    ano_inicial = ANO_INICIAL
-    ano_final = ANO_FINAL
-    serie = 12
-    numero = 1
-    ano = ano_inicial
-
-    # Loop into brazillian states
-    for estado in ESTADOS_BRASILEIROS:
-        
-        # Return initial variables to default value.
-        ano = ano_inicial
-        df_ano = None
-
-        # Loop between years that will be analyze
-        while ano_inicial <= ano_final:
-            
-            # Loop into months
-            while numero <= serie:
-
-                # Creating name of file to reading.
-                nome_arquivo = f"""{RAW_PATH}ETLSIH/ETLSIH.ST_{estado}_{ano}_{numero}_t.csv"""
 
-                try:
-                    # Query to return fields that we need.
-                    df = conn.execute(f"""SELECT int_muncod, 
-                                                 int_munnome, 
-                                                 ano_cmpt, 
-                                                 mes_cmpt, 
-                                                 def_sexo, 
-                                                 val_sh, 
-                                                 val_sp, 
-                                                 val_tot, 
-                                                 val_uti,
-                                                 diag_princ, 
-                                                 idade, 
-                                                 raca_cor, 
-                                                 int_capital, 
-                                                 int_sigla_uf, 
-                                                 int_codigo_uf, 
-                                                 int_regiao, 
-                                                 int_nome_uf,
-                                                 dia_semana_internacao,
-                                                 ano_internacao, 
-                                                 mes_internacao, 
-                                                 def_procedimento_realizado, 
-                                                 def_procedimento_solicitado,
-                                                 def_leitos, 
-                                                 def_diag_princ_cap, 
-                                                 def_diag_princ_grupo,
-                                                 def_diag_secun_grupo,
-                                                 def_diag_princ_cat,
-                                                 def_diag_secun_cat,
-                                                 def_diag_princ_subcat, 
-                                                 def_car_int, 
-                                                 def_cobranca,
-                                                 def_morte, 
-                                                 def_raca_cor, 
-                                                 def_idade_pub,
-                                                DIAGSEC1
-                                      FROM read_csv('{nome_arquivo}') where (DIAGSEC1 LIKE 'V%' AND DIAGSEC1 NOT LIKE 'V9%') AND int_muncod IN ({CODIGO_IBGE_SIH});""").fetchdf()
-                except FileNotFoundError as e:
-                    print(f"Error: {e}")
-
-                # Increment month.
-                numero += 1
-
-                # Concat first dataframe with dataframe in this loop
-                df_ano = pd.concat([df_ano, df], ignore_index=True)
-            
-            # Transform ['MES_CMPT'] field to string.
-            df_ano['MES_CMPT'] = df_ano['MES_CMPT'].astype(str)
-            
-            # Increment month and year variables.
-            ano = ano + 1
-            ano_inicial = ano
-            numero = 1
-
-        # Creating .parquet file agregate all years per state
-        df_ano.to_parquet(f"""{SILVER_PATH}ETLSIH_parquet/ETLSIH.ST_{estado}.parquet""", engine='pyarrow', compression='snappy')
-
-        # Increment support variables.
-        numero = 1
-        ano_inicial = ANO_INICIAL
-
-def analise(conn) -> None:
+    caminho = f"""{CACHE_PATH}indice.json"""
+
+    with TRAVA_CACHE:
+        indice = ler_indice_cache()
+        indice[secao][chave] = valor
+
+        with open(f"""{caminho}.tmp""", "w", encoding="utf-8") as arquivo:
+            json.dump(indice, arquivo, indent=2, sort_keys=True)
+
+        os.replace(f"""{caminho}.tmp""", caminho)
+
+def informacoes_remotas(url) -> dict:
     """
     [Description]
 
-        Performing data analysis.
-    
+        Reads the headers of a remote file.
+
     [Source]
 
         None
 
     [Goal]
 
-        Reading and join information from all .parquet files, to analyze all of data.
-    
+        Returning the size, the ETag and the support to range requests of the file, without downloading it.
+
     """
 
-    # Performing .parquet files in dataframe.
+    with urllib.request.urlopen(urllib.request.Request(url, method="HEAD")) as resposta:
+        tamanho = resposta.headers.get("Content-Length")
 
-    acidentes = conn.read_parquet("acidentes-geral.parquet").df()
+        return {
+            "tamanho": int(tamanho) if tamanho is not None else None,
+            "etag": resposta.headers.get("ETag") or resposta.headers.get("Last-Modified"),
+            "intervalos": resposta.headers.get("Accept-Ranges") == "bytes",
+        }
 
-    carteira = conn.read_parquet("simu-carteira-mun-T.parquet").df()
+def baixar_intervalo(url, destino, inicio=None, fim=None) -> None:
+    """
+    [Description]
 
-    frota = conn.read_parquet("simu-frota-mun_T.parquet").df()
+        Downloads a byte range of a remote file.
 
-    sih = conn.read_parquet("ETLSIH_parquet/ETLSIH.ST_*.parquet", union_by_name=True).df()
-    
-    # Convert [cod] field to string.
-    acidentes['cod_sih'] = acidentes['cod'].astype(str)
+    [Source]
+
+        None
+
+    [Goal]
+
+        Writing the bytes inicio..fim (inclusive) of the file to destino, resuming from the bytes already in destino.
+        Without inicio the whole file is downloaded again. A body shorter than announced raises a RuntimeError.
+
+    """
 
-    # Removing last [cod] character to use as key in merge with ETLSIH data.
-    acidentes['cod_sih'] = acidentes['cod_sih'].str[:-1]  
+    requisicao = urllib.request.Request(url)
+    modo = "wb"
 
-    # Convert [Código IBGE] field to string.
-    carteira['cod_sih'] = carteira['Código IBGE'].astype(str)
+    if inicio is not None:
+        feito = os.path.getsize(destino) if os.path.exists(destino) else 0
 
-    # Removing last [cod] character to use as key in merge with ETLSIH data.
-    carteira['cod_sih'] = carteira['cod_sih'].str[:-3]
+        if inicio + feito > fim:
+            return
 
-    # Convert [Código IBGE] field to string.
-    frota['cod_sih'] = frota['Código IBGE'].astype(str)
+        requisicao.add_header("Range", f"bytes={inicio + feito}-{fim}")
+        modo = "ab"
 
-    # Removing last [cod] character to use as key in merge with ETLSIH data.
-    frota['cod_sih'] = frota['cod_sih'].str[:-1]
+    with urllib.request.urlopen(requisicao) as resposta, open(destino, modo) as arquivo:
 
-    # Rename [ANO_CMPT] field to use as key in merge.
-    sih.rename(columns={"ANO_CMPT": "ano"}, inplace=True)
+        if inicio is not None and resposta.status != 206:
+            raise RuntimeError(f"Range request not honored for {url}")
 
-    # Rename [int_MUNCOD] field to use as key in merge.
-    sih.rename(columns={"int_MUNCOD": "cod"}, inplace=True)
+        tamanho = resposta.headers.get("Content-Length")
 
-    # Convert [cod] field to string.
-    sih['cod_sih'] = sih['cod'].astype(str)
+        shutil.copyfileobj(resposta, arquivo, TAMANHO_BLOCO)
 
+    # A connection closed early ends the body without an error: the bytes received are kept,
+    # and the next call requests only the missing ones.
+    esperado = fim - inicio + 1 if inicio is not None else (int(tamanho) if tamanho is not None else None)
+
+    if esperado is not None and os.path.getsize(destino) != esperado:
+        raise RuntimeError(f"Connection closed before the end of {url} ({os.path.getsize(destino)} of {esperado} bytes)")
+
+def baixar_arquivo(url) -> str:
     """
+    [Description]
 
-    Data analyze from SIMU files - Motorization - Evolutionary Fleet vs data from ETLSIH.
-    
-    Study of the increase in rates and hospitalizations caused by traffic accidents for municipalities of Rio de Janeiro, São Paulo and the Federal District by population size.
+        Downloads a file to the content-addressed cache.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Returning the path of the file in CACHE_PATH/objetos/{sha256}, downloading it only if its ETag or size changed.
+        When the server accepts range requests, the file is split in up to PARTES_DOWNLOAD parts downloaded concurrently,
+        kept in CACHE_PATH/partes until complete, so an interrupted download resumes where it stopped.
+        The parts are joined into the first one, each removed once appended, so a download never takes much more
+        disk than the file itself. The object of the previous version of the url is removed, unless another url
+        has the same content.
+        Offline, the cached copy is used.
 
     """
 
-    # Performing merge with ETLSIH and Evolutionary Fleet
-    df_sih_frota = sih.merge(
-        frota, on=["cod_sih", "ano"], how="inner"
-    )
+    entrada = ler_indice_cache()["downloads"].get(url)
+
+    try:
+        remoto = informacoes_remotas(url)
+    except urllib.error.URLError as e:
+        if entrada is not None and os.path.exists(entrada["caminho"]):
+            print(f"Warning: {url} unreachable ({e}), using the cached copy")
+            return entrada["caminho"]
+        raise
+
+    if (entrada is not None and os.path.exists(entrada["caminho"])
+            and entrada["etag"] == remoto["etag"] and entrada["tamanho"] == remoto["tamanho"]):
+        return entrada["caminho"]
+
+    # Parts of a download are named after the url and version, so a new version never resumes an old one.
+    versao = hashlib.sha256(f"{url}|{remoto['etag']}|{remoto['tamanho']}".encode()).hexdigest()[:16]
+    pasta_partes = f"""{CACHE_PATH}partes/{versao}/"""
+    os.makedirs(pasta_partes, exist_ok=True)
+
+    if remoto["intervalos"] and remoto["tamanho"]:
+        quantidade = max(1, min(PARTES_DOWNLOAD, math.ceil(remoto["tamanho"] / TAMANHO_MINIMO_PARTE)))
+        tamanho_parte = math.ceil(remoto["tamanho"] / quantidade)
+
+        intervalos = [
+            (inicio, min(inicio + tamanho_parte, remoto["tamanho"]) - 1)
+            for inicio in range(0, remoto["tamanho"], tamanho_parte)
+        ]
+
+        # A first part longer than its range comes from a join that was interrupted: the download starts again.
+        primeira = f"{pasta_partes}0.part"
+
+        if os.path.exists(primeira) and os.path.getsize(primeira) > intervalos[0][1] + 1:
+            shutil.rmtree(pasta_partes)
+            os.makedirs(pasta_partes)
+
+        with ThreadPoolExecutor(max_workers=len(intervalos)) as executor:
+            tarefas = [
+                executor.submit(baixar_intervalo, url, f"{pasta_partes}{indice}.part", inicio, fim)
+                for indice, (inicio, fim) in enumerate(intervalos)
+            ]
+
+            for tarefa in tarefas:
+                tarefa.result()
+    else:
+        intervalos = [None]
+        baixar_intervalo(url, f"{pasta_partes}0.part")
+
+    # Joining the parts into the first one while hashing them.
+    temporario = f"{pasta_partes}0.part"
+    sha = hashlib.sha256()
+
+    with open(temporario, "r+b") as destino:
+        for bloco in iter(lambda: destino.read(TAMANHO_BLOCO), b""):
+            sha.update(bloco)
+
+        destino.seek(0, os.SEEK_END)
 
-    # Select columns to use.
-    df_sih_frota = df_sih_frota[['int_MUNNOME', 'ano','TOTAL_VEICULOS','Populacao']]
+        for indice in range(1, len(intervalos)):
+            with open(f"{pasta_partes}{indice}.part", "rb") as parte:
+                for bloco in iter(lambda: parte.read(TAMANHO_BLOCO), b""):
+                    sha.update(bloco)
+                    destino.write(bloco)
 
-    # Counts hospitalizations grouped by year and municipality.
-    df_sih_frota = df_sih_frota.groupby(['int_MUNNOME', 'ano','TOTAL_VEICULOS','Populacao']).size().reset_index(name='TOTAL_INTERNACOES')
+            os.remove(f"{pasta_partes}{indice}.part")
 
-    # Calculates the rate of hospitalizations per population per year.
-    df_sih_frota['TAXA_INTERNACOES_POPULACAO'] = df_sih_frota['TOTAL_INTERNACOES']/df_sih_frota['Populacao']*100
+    if remoto["tamanho"] is not None and os.path.getsize(temporario) != remoto["tamanho"]:
+        shutil.rmtree(pasta_partes)
+        raise RuntimeError(f"Incomplete download of {url}")
 
-    # Calculates the rate of population increase each year by municipality.
-    df_sih_frota['PERCENTUAL_AUMENTO_POPULACAO'] = df_sih_frota.groupby('int_MUNNOME')['Populacao'].pct_change()
+    os.makedirs(f"""{CACHE_PATH}objetos""", exist_ok=True)
+    caminho = f"""{CACHE_PATH}objetos/{sha.hexdigest()}"""
+    os.replace(temporario, caminho)
+    shutil.rmtree(pasta_partes)
 
-    print("Analysis of ETLSIH data (Hospital Data) x Fleet and Population")
-    print(df_sih_frota)
+    atualizar_indice_cache("downloads", url, {"caminho": caminho, "etag": remoto["etag"], "tamanho": remoto["tamanho"]})
+
+    if entrada is not None and entrada["caminho"] != caminho:
+        remover_objeto(entrada["caminho"])
+
+    return caminho
+
+def remover_objeto(caminho, url=None) -> None:
+    """
+    [Description]
+
+        Removes an object of the download cache.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Deleting CACHE_PATH/objetos/{sha256} unless a url other than url still references it.
 
     """
 
-    Analysis of accident data from IPEA and SIMU x Frota
+    with TRAVA_CACHE:
+        referenciados = {
+            entrada["caminho"] for outra, entrada in ler_indice_cache()["downloads"].items() if outra != url
+        }
 
-    Study of the increase in deaths/injuries per number of vehicles/population and accident rate per population for the municipalities of Rio de Janeiro, São Paulo and the Federal District.
+        if caminho not in referenciados and os.path.exists(caminho):
+            os.remove(caminho)
 
+def extracao_atual(url, destino, padrao, filtro=None) -> list:
     """
+    [Description]
 
-    # Merges IPEA and SIMU data with Fleet data
-    df_acidentes_frota = acidentes.merge(
-        frota, on=["cod_sih", "ano", "Município"], how="inner"
-    )
+        Checks whether the files extracted from a url are still current.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Returning the paths of the files extracted from url when its ETag and size are unchanged (or the server is
+        unreachable) and every member matching padrao and filtro is on disk with the CRC, size and mtime recorded
+        at extraction, so an archive deleted after extraction is not downloaded again. Otherwise returns None.
+
+    """
+
+    indice = ler_indice_cache()
+    entrada = indice["downloads"].get(url)
+
+    if entrada is None or "membros" not in entrada:
+        return None
+
+    try:
+        remoto = informacoes_remotas(url)
+
+        if [entrada["etag"], entrada["tamanho"]] != [remoto["etag"], remoto["tamanho"]]:
+            return None
+    except urllib.error.URLError as e:
+        print(f"Warning: {url} unreachable ({e}), using the extracted files")
+
+    extraidos = []
+
+    for nome, crc in entrada["membros"].items():
+
+        if not fnmatch.fnmatch(nome, padrao) or (filtro is not None and not filtro(nome)):
+            continue
+
+        caminho = f"{destino}{nome}"
+        anterior = indice["extracoes"].get(caminho)
+
+        if anterior is None or not os.path.exists(caminho):
+            return None
+
+        info = os.stat(caminho)
+
+        if [anterior["crc"], anterior["tamanho"], anterior["mtime_ns"]] != [crc, info.st_size, info.st_mtime_ns]:
+            return None
+
+        extraidos.append(caminho)
+
+    return extraidos
+
+def extrair_membros(caminho_zip, destino, padrao, filtro=None) -> list:
+    """
+    [Description]
+
+        Extracts the .csv members of a .zip file to the raw layer.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Streaming each member matching padrao (and filtro, applied to the file name) to destino, flattening
+        the directories of the .zip. Members already extracted and unchanged (same CRC, size and mtime) are
+        not written again, so the mtimes seen by the pipeline only change with the content.
+        Returns the paths of the extracted files.
 
-    # Defines the columns to be analyzed.
-    df_acidentes_frota = df_acidentes_frota[['cod_sih','Município', 'ano','TOTAL_VEICULOS','Populacao_y', 'total_mortes', 'total_feridos']]
+    """
+
+    os.makedirs(destino, exist_ok=True)
+
+    extracoes = ler_indice_cache()["extracoes"]
+    extraidos = []
+
+    with zipfile.ZipFile(caminho_zip) as arquivo_zip:
+        for membro in arquivo_zip.infolist():
+
+            nome = os.path.basename(membro.filename)
+
+            if membro.is_dir() or not fnmatch.fnmatch(nome, padrao) or (filtro is not None and not filtro(nome)):
+                continue
+
+            caminho = f"{destino}{nome}"
+            anterior = extracoes.get(caminho)
+
+            if anterior is not None and os.path.exists(caminho):
+                info = os.stat(caminho)
 
-    # Calculates the total number of accidents.
-    df_acidentes_frota['TOTAL_DE_ACIDENTES'] = df_acidentes_frota['total_mortes']+df_acidentes_frota['total_feridos']
+                if [anterior["crc"], anterior["tamanho"], anterior["mtime_ns"]] == [membro.CRC, info.st_size, info.st_mtime_ns]:
+                    extraidos.append(caminho)
+                    continue
+
+            with arquivo_zip.open(membro) as origem, open(f"{caminho}.tmp", "wb") as saida:
+                shutil.copyfileobj(origem, saida, TAMANHO_BLOCO)
+
+            os.replace(f"{caminho}.tmp", caminho)
+
+            info = os.stat(caminho)
+            atualizar_indice_cache("extracoes", caminho, {"crc": membro.CRC, "tamanho": info.st_size, "mtime_ns": info.st_mtime_ns})
+
+            extraidos.append(caminho)
+
+    return extraidos
+
+def adquirir_fonte(fonte, escopo, descartar=False) -> list:
+    """
+    [Description]
 
-    # Calculates the rate of Deaths due to Injuries.
-    df_acidentes_frota['TAXA_FERIDOS_MORTES'] = df_acidentes_frota['total_mortes']/df_acidentes_frota['total_feridos']*100
+        Downloads and extracts one archive of FONTES.
 
-    # Calculates the population rate per vehicle.
-    df_acidentes_frota['TAXA_POPULACAO_VEICULOS'] = df_acidentes_frota['TOTAL_VEICULOS']/df_acidentes_frota['Populacao_y']*100
+    [Source]
 
-    # Calculates the Accident rate by Population.
-    df_acidentes_frota['TAXA_ACIDENTES_POPULACAO'] = (df_acidentes_frota['total_mortes'] + df_acidentes_frota['total_feridos'])/df_acidentes_frota['Populacao_y']*100
+        Link: https://bigdata-arquivos.icict.fiocruz.br/PUBLICO/
 
-    # Calculates the rate of population increase each year by municipality.
-    df_acidentes_frota['PERCENTUAL_AUMENTO_ACIDENTES'] = df_acidentes_frota.groupby('Município')['TOTAL_DE_ACIDENTES'].pct_change()
+    [Goal]
 
-    print("Analysis of accident data from IPEA and SIMU x Frota")
-    print(df_acidentes_frota)
+        Fetching the archive through the cache (see baixar_arquivo) and extracting its .csv files to the raw layer.
+        Only the ETLSIH files of the states and years of the scope are extracted. The CRC of each member is
+        recorded in the index, and with descartar the archive is deleted once extracted: later runs check the
+        ETag, size and CRCs (see extracao_atual) and download it again only when something changed.
 
     """
 
-    Analysis of ETLSIH data (Hospital Data) x Enterprise Portfolio
+    caminho, pasta, padrao = FONTES[fonte]
+
+    filtro = None
+
+    if fonte == "etlsih":
+        def filtro(nome):
+            correspondencia = re.match(r"ETLSIH\.ST_([A-Z]{2})_(\d{4})_\d{1,2}_t\.csv$", nome)
+            return (correspondencia is not None
+                    and correspondencia.group(1) in escopo.ufs
+                    and escopo.ano_inicial <= int(correspondencia.group(2)) <= escopo.ano_final)
+
+    url = f"{URL_BASE}{caminho}"
+
+    if descartar:
+        extraidos = extracao_atual(url, f"{RAW_PATH}{pasta}", padrao, filtro)
+
+        if extraidos:
+            return extraidos
+
+    caminho_zip = baixar_arquivo(url)
 
-    Study of the increase in hospitalizations for the municipalities of Rio de Janeiro, São Paulo and the Federal District associated with the portfolio of projects.
+    extraidos = extrair_membros(caminho_zip, f"{RAW_PATH}{pasta}", padrao, filtro)
 
+    if not extraidos:
+        print(f"Error: no files extracted from {caminho}")
+
+    with zipfile.ZipFile(caminho_zip) as arquivo_zip:
+        membros = {
+            os.path.basename(membro.filename): membro.CRC
+            for membro in arquivo_zip.infolist() if fnmatch.fnmatch(os.path.basename(membro.filename), padrao)
+        }
+
+    entrada = ler_indice_cache()["downloads"][url]
+    atualizar_indice_cache("downloads", url, {**entrada, "membros": membros})
+
+    if descartar and extraidos:
+        remover_objeto(caminho_zip, url)
+
+    return extraidos
+
+def query_acidentes_IPEA(escopo) -> str:
     """
+    [Description]
+
+        Builds the query of the traffic accident files by year and municipality, made available by IPEA.
+
+    [Source]
 
-    # Counts the works carried out grouping them by year and municipality.
-    carteira_valores = carteira.groupby(['cod_sih', 'ano_fim_obra']).size().reset_index(name='TOTAL_OBRAS')
+        Link: https://www.ipea.gov.br/atlasviolencia/filtros-series/12/violencia-no-transito
 
-    # Format the [year] field
-    carteira_valores['ano'] = carteira_valores['ano_fim_obra'].astype(str).str[:-2]
+    [Goal]
 
-    # Remove unnecessary field
-    carteira_valores = carteira_valores.drop(columns=['ano_fim_obra'])
+        Reading all series in one multi-file scan, taking the series name from the file name,
+        and pivoting the series to one column each.
 
-    # Realiza a contagem das internações agrupando por ano e município.
-    sih_valores = sih.groupby(['cod_sih', 'ano', 'int_MUNNOME']).size().reset_index(name='TOTAL_INTERNACOES')
+    """
 
-    # Counts hospitalizations grouped by year and municipality.
-    sih_valores['ano'] = sih_valores['ano'].astype(str)
+    # List of files read by duckdb as one scan.
+    lista_arquivos = ", ".join(f"'{RAW_PATH}IPEA/{serie}.csv'" for serie in SERIES_IPEA)
 
-    # Merge SIH data with Portfolio data
-    df_sih_carteira = sih_valores.merge(
-        carteira_valores, on=["cod_sih", "ano"], how="inner"
+    # One aggregate per series, counts as integers and rates as doubles.
+    colunas_series = ",\n".join(
+        f"""CAST(max(valor) FILTER (WHERE serie = '{serie}') AS {'DOUBLE' if coluna.startswith('taxa') else 'BIGINT'}) AS {coluna}"""
+        for serie, coluna in SERIES_IPEA.items()
     )
 
-    # Calculates the rate of increase in hospitalizations each year by municipality and number of works
-    df_sih_carteira['PERCENTUAL_AUMENTO_INTERNACOES'] = df_sih_carteira.groupby('int_MUNNOME')['TOTAL_INTERNACOES'].pct_change()
+    # Query pivoting the series by municipality and year.
+    return f"""
+        WITH series AS (
+            SELECT cod, nome, "período", valor, regexp_extract(filename, '([^/]+)\\.csv$', 1) AS serie
+            FROM read_csv([{lista_arquivos}], union_by_name = true, filename = true)
+            WHERE {escopo.filtro("cod")} AND CAST("período" AS INTEGER) BETWEEN {ANO_INICIAL_IPEA} AND {ANO_FINAL_IPEA}
+        )
+        SELECT cod,
+               any_value(nome) FILTER (WHERE serie = '{SERIE_IPEA_PRINCIPAL}') AS nome,
+               "período",
+               {colunas_series}
+        FROM series
+        GROUP BY cod, "período"
+        -- Keeping only the rows of the main series, as a left join starting from it.
+        HAVING count(*) FILTER (WHERE serie = '{SERIE_IPEA_PRINCIPAL}') > 0
+        ORDER BY "período", cod
+    """
 
-    print("Analysis of ETLSIH data (Hospital Data) x Enterprise Portfolio")
-    print(df_sih_carteira)
+def ler_acidentes_IPEA(conn, escopo) -> None:
+    """
+    [Description]
 
-if __name__ == '__main__':
+        Reads traffic accident files by year and municipality, made available by IPEA.
+        Numbers and rates of deaths from traffic accidents in Brazil, by year, municipality, sex. 
+    
+    [Source]
+
+        Link: https://www.ipea.gov.br/atlasviolencia/filtros-series/12/violencia-no-transito
+
+    [Goal]
+
+        Reading of all files aggregated by year and municipality, making them available in a .parquet file,
+        seeking to obtain better performance in data analysis.
+    
+    """
+
+    # Creating .parquet file.
+    exportar_parquet(conn, query_acidentes_IPEA(escopo), f"""{SILVER_PATH}acidentes-IPEA.parquet""")
+
+def ler_acidentes(conn, escopo) -> None:
+    """
+    [Description]
+
+        Reads SIMU files - Transport Accidents.
+        Records with the fields necessary for the analysis.
+    
+    [Source]
+
+        Link: https://bigdata-arquivos.icict.fiocruz.br/PUBLICO/SIMU/temas/simu-acidentes-transportes-mun-T.zip
+
+    [Goal]
+
+        Reading the .csv file through duckdb, joining it with the IPEA accidents (by municipality and year)
+        and writing the result straight to a .parquet file.
+        The IPEA accidents are read from the file written by ler_acidentes_IPEA.
+    
+    """
+
+    # Query joining SIMU data with IPEA data, 'Código IBGE' renamed to 'cod' and 'período' used as 'ano'.
+    query = f"""
+        SELECT simu."Código IBGE" AS cod, simu.* EXCLUDE ("Código IBGE"), ipea.* EXCLUDE (cod, "período")
+        FROM read_csv('{RAW_PATH}SIMU - Acidentes de Transportes/Acidentes de Transportes.csv') simu
+        JOIN read_parquet('{SILVER_PATH}acidentes-IPEA.parquet') ipea
+        ON ipea.cod = simu."Código IBGE" AND ipea."período" = simu.ano
+        WHERE {escopo.filtro('simu."Código IBGE"')}
+    """
+
+    # Creating .parquet file.
+    exportar_parquet(conn, query, f"""{SILVER_PATH}acidentes-geral.parquet""")
+ 
+def ler_carteira(conn, escopo) -> None:
+    """
+    [Description]
+
+        Reads the SIMU files - Enterprise Portfolio.
+        Records with the fields necessary for the analysis.
+
+    [Source]
+
+        Link: https://bigdata-arquivos.icict.fiocruz.br/PUBLICO/SIMU/bases_dados/CARTEIRA/simu-carteira-mun-T.zip
+
+    [Goal]
+
+        Reading the .csv file through duckdb and writing the records of the scope straight to a .parquet file.
+
+
+    """
+
+    # Create .parquet file.
+    exportar_parquet(
+        conn,
+        f"""SELECT * FROM read_csv('{RAW_PATH}simu-carteira-mun-T.csv') WHERE {escopo.filtro('"Código IBGE"')}""",
+        f"""{SILVER_PATH}simu-carteira-mun-T.parquet""",
+    )
+
+def ler_frotas(conn, escopo) -> None:
+    """
+    [Description]
+
+        Reads SIMU files - Motorization - Evolutionary Fleet.
+        Records with the fields necessary for the analysis.
+
+    [Source]
+
+        Link: https://bigdata-arquivos.icict.fiocruz.br/PUBLICO/SIMU/bases_dados/FROTA/simu-frota-mun_T.zip
+
+    [Goal]
+
+        Reading the .csv file through duckdb and writing the records of the scope straight to a .parquet file.
+
+    """
+
+    # Creating .parquet file.
+    exportar_parquet(
+        conn,
+        f"""SELECT * FROM read_csv('{RAW_PATH}simu-frota-mun_T.csv') WHERE {escopo.filtro('"Código IBGE"')}""",
+        f"""{SILVER_PATH}simu-frota-mun_T.parquet""",
+    )
+
+def gerar_dim_municipio(conn) -> None:
+    """
+    [Description]
+
+        Builds the municipality dimension.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Mapping once, with integer keys, the IBGE code (7 digits), the SIH code (6 digits, without the check digit),
+        the name and the state of every municipality of the fleet, accidents and portfolio silver files,
+        so every dataset joins on the same keys (see RELATORIOS) instead of converting codes per record.
+        Names come from the fleet, then from the accidents, and the state from the first two digits of the code.
+
+    """
+
+    # Sources of the codes, by priority of their names.
+    fontes = [
+        (f"""{SILVER_PATH}simu-frota-mun_T.parquet""", '"Código IBGE"', '"Município"'),
+        (f"""{SILVER_PATH}acidentes-geral.parquet""", "cod", '"Município"'),
+        (f"""{SILVER_PATH}simu-carteira-mun-T.parquet""", '"Código IBGE"', "NULL"),
+    ]
+
+    codigos = "\nUNION ALL\n".join(
+        f"""SELECT CAST({codigo} AS INTEGER) AS cod_ibge, {nome} AS nome, {prioridade} AS prioridade
+            FROM read_parquet('{caminho}') WHERE {codigo} IS NOT NULL"""
+        for prioridade, (caminho, codigo, nome) in enumerate(fontes)
+        if os.path.exists(caminho)
+    )
+
+    exportar_parquet(conn, f"""
+        WITH codigos AS ({codigos}),
+        ufs AS (
+            SELECT unnest({list(CODIGOS_UF)}) AS uf, unnest({list(CODIGOS_UF.values())}) AS codigo_uf
+        )
+        SELECT c.cod_ibge,
+               CAST(c.cod_ibge // 10 AS INTEGER) AS cod_sih,
+               arg_min(c.nome, c.prioridade) FILTER (WHERE c.nome IS NOT NULL) AS nome,
+               any_value(u.uf) AS uf
+        FROM codigos c
+        LEFT JOIN ufs u ON u.codigo_uf = c.cod_ibge // 100000
+        GROUP BY c.cod_ibge
+        ORDER BY c.cod_ibge
+    """, f"""{SILVER_PATH}dim_municipio.parquet""")
+
+def arquivos_etlsih(estado, escopo) -> list:
+    """
+    [Description]
+
+        Lists the monthly SIHSUS files available for a state.
+
+    [Source]
+
+        Link: https://bigdata-arquivos.icict.fiocruz.br/PUBLICO/SIH/ETLSIH.zip
+
+    [Goal]
+
+        Returning the paths of every ETLSIH.ST_{UF}_{ano}_{mes}_t.csv file between the initial and final years of the scope
+        that exists in the raw layer, so the whole set can be handed to duckdb in a single scan.
+
+    """
+
+    arquivos = []
+
+    # Loop between years and months that will be analyze
+    for ano in range(escopo.ano_inicial, escopo.ano_final + 1):
+        for mes in range(1, 13):
+
+            # Creating name of file to reading.
+            nome_arquivo = f"""{RAW_PATH}ETLSIH/ETLSIH.ST_{estado}_{ano}_{mes}_t.csv"""
+
+            if os.path.exists(nome_arquivo):
+                arquivos.append(nome_arquivo)
+            else:
+                print(f"Error: file not found {nome_arquivo}")
+
+    return arquivos
+
+def hash_arquivo(caminho) -> str:
+    """
+    [Description]
+
+        Calculates the sha256 hash of a file.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Detecting content changes of raw files, reading them in blocks to keep memory usage constant.
+
+    """
+
+    sha = hashlib.sha256()
+
+    with open(caminho, "rb") as arquivo:
+        for bloco in iter(lambda: arquivo.read(1024 * 1024), b""):
+            sha.update(bloco)
+
+    return sha.hexdigest()
+
+def ler_manifesto_etlsih() -> dict:
+    """
+    [Description]
+
+        Reads the manifest of the ETLSIH silver layer.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Returning, for each raw file already ingested, its size, mtime, content hash and the silver partition it produced.
+
+    """
+
+    caminho = f"""{SILVER_PATH}ETLSIH_manifest.json"""
+
+    if not os.path.exists(caminho):
+        return {}
+
+    with open(caminho, encoding="utf-8") as arquivo:
+        return json.load(arquivo)
+
+def gravar_manifesto_etlsih(manifesto) -> None:
+    """
+    [Description]
+
+        Writes the manifest of the ETLSIH silver layer.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Persisting the state of the ingestion, so the next run only processes new or changed months.
+
+    """
+
+    caminho = f"""{SILVER_PATH}ETLSIH_manifest.json"""
+
+    # Write to a temporary file first, so an interrupted run never leaves a broken manifest.
+    with open(f"""{caminho}.tmp""", "w", encoding="utf-8") as arquivo:
+        json.dump(manifesto, arquivo, indent=2, sort_keys=True)
+
+    os.replace(f"""{caminho}.tmp""", caminho)
+
+def particao_etlsih(estado, nome_arquivo) -> str:
+    """
+    [Description]
+
+        Returns the silver partition produced by a raw ETLSIH file.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Mapping ETLSIH.ST_{UF}_{ano}_{mes}_t.csv to the hive directory uf={UF}/ano={ano}/mes={mes}.
+
+    """
+
+    ano, mes = os.path.basename(nome_arquivo).split("_")[2:4]
+
+    return f"""{SILVER_PATH}ETLSIH_parquet/uf={estado}/ano={ano}/mes={mes}"""
+
+def query_cid10(coluna) -> str:
+    # SQL of codigo_cid10, null for codes that are not an ICD-10 category (letter and two digits).
+    return f"""CASE WHEN regexp_matches({coluna}, '^[A-Za-z][0-9]{{2}}')
+                    THEN CAST((ascii(upper({coluna}[1])) - 65) * 100 + CAST(substr({coluna}, 2, 2) AS INTEGER) AS SMALLINT) END"""
+
+def projecao_sih() -> str:
+    """
+    [Description]
+
+        Builds the projection of the ETLSIH files.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Casting every field of ESQUEMA_SIH to its type while the csv is read, and adding the competence date DT_CMPT
+        and the ICD-10 categories of the main and secondary diagnoses as integers (cid_principal and cid_secundario,
+        see codigo_cid10), so filters on diagnoses are integer ranges and the labels come from dim_cid10.
+
+    """
+
+    colunas = [f"CAST({coluna} AS {tipo}) AS {coluna}" for coluna, tipo in ESQUEMA_SIH.items()]
+
+    colunas.append("make_date(CAST(ANO_CMPT AS INTEGER), CAST(MES_CMPT AS INTEGER), 1) AS DT_CMPT")
+
+    colunas.append(f"{query_cid10('DIAG_PRINC')} AS cid_principal")
+    colunas.append(f"{query_cid10('DIAGSEC1')} AS cid_secundario")
+
+    return ",\n".join(colunas)
+
+def particao_atual(anterior, particao, escopo) -> bool:
+    """
+    [Description]
+
+        Checks if the partition of a manifest entry is up to date.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        A partition is reused only when it exists, is in the current layout and was written with
+        the current scope and schema (ESQUEMA_SIH).
+
+    """
+
+    return (anterior is not None
+            and anterior["particao"] == particao
+            and anterior.get("escopo") == escopo.chave()
+            and anterior.get("esquema") == VERSAO_ESQUEMA_SIH
+            and os.path.isdir(particao))
+
+def ler_etlsih_estado(conn, estado, manifesto, escopo, arquivos=None, forcar=False) -> dict:
+    """
+    [Description]
+
+        Reads the new or changed SIHSUS files of one state in a single duckdb scan.
+
+    [Source]
+
+        Link: https://bigdata-arquivos.icict.fiocruz.br/PUBLICO/SIH/ETLSIH.zip
+
+    [Goal]
+
+        Comparing each raw file with the manifest (size, mtime and content hash) and ingesting only the months
+        that are new or changed, as new uf/ano/mes partitions of the .parquet dataset.
+        Every hospitalization with an external cause (CID10_CAUSAS_EXTERNAS) as secondary diagnosis is kept, so other
+        causes than traffic accidents can be analyzed without ingesting the raw files again.
+        The column projection and the external cause/municipality filter are pushed down into the csv scan
+        and the partitions are written straight from duckdb, without building a pandas dataframe.
+        Only the given files are considered (all files of the state by default).
+        With forcar, every file is ingested again, whatever the manifest says.
+        Returns the manifest entries of the state.
+
+    """
+
+    entradas = {}
+    alterados = []
+
+    for nome_arquivo in arquivos if arquivos is not None else arquivos_etlsih(estado, escopo):
+
+        info = os.stat(nome_arquivo)
+        anterior = manifesto.get(nome_arquivo)
+        particao = particao_etlsih(estado, nome_arquivo)
+
+        # Same size and mtime: the file is unchanged, no need to hash it again.
+        if (not forcar and particao_atual(anterior, particao, escopo)
+                and anterior["tamanho"] == info.st_size
+                and anterior["mtime"] == info.st_mtime_ns):
+            entradas[nome_arquivo] = anterior
+            continue
+
+        hash_atual = hash_arquivo(nome_arquivo)
+
+        entradas[nome_arquivo] = {
+            "tamanho": info.st_size,
+            "mtime": info.st_mtime_ns,
+            "hash": hash_atual,
+            "particao": particao,
+            "escopo": escopo.chave(),
+            "esquema": VERSAO_ESQUEMA_SIH,
+        }
+
+        # Only the mtime changed (e.g. file copied again), content is the same.
+        if not forcar and particao_atual(anterior, particao, escopo) and anterior["hash"] == hash_atual:
+            continue
+
+        # Removing the old partition of a changed month before writing it again.
+        shutil.rmtree(particao, ignore_errors=True)
+
+        alterados.append(nome_arquivo)
+
+    if not alterados:
+        return entradas
+
+    print(f"ETLSIH {estado}: ingesting {len(alterados)} new or changed files")
+
+    # List of files read by duckdb as one scan.
+    lista_arquivos = ", ".join(f"'{arquivo}'" for arquivo in alterados)
+
+    # Query to return fields that we need, written directly as one partition per state, year and month of the raw file.
+    # Records are sorted by municipality, so the row group statistics let filters on int_MUNCOD skip row groups.
+    conn.execute(f"""COPY (SELECT {projecao_sih()},
+                                 '{estado}' AS uf,
+                                 CAST(regexp_extract(filename, '_(\\d+)_(\\d+)_t\\.csv$', 1) AS INTEGER) AS ano,
+                                 CAST(regexp_extract(filename, '_(\\d+)_(\\d+)_t\\.csv$', 2) AS INTEGER) AS mes
+                          FROM read_csv([{lista_arquivos}], union_by_name = true, filename = true)
+                          WHERE {query_cid10("DIAGSEC1")} BETWEEN {CID10_CAUSAS_EXTERNAS[0]} AND {CID10_CAUSAS_EXTERNAS[1]}
+                            AND {escopo.filtro("int_muncod", sih=True)}
+                          ORDER BY int_muncod)
+                     TO '{SILVER_PATH}ETLSIH_parquet'
+                     (FORMAT PARQUET, COMPRESSION {COMPRESSAO_SIH}, ROW_GROUP_SIZE {TAMANHO_ROW_GROUP},
+                      PARTITION_BY (uf, ano, mes), OVERWRITE_OR_IGNORE);""")
+
+    # Months without records still get an (empty) partition, so they are not ingested again.
+    for nome_arquivo in alterados:
+        os.makedirs(entradas[nome_arquivo]["particao"], exist_ok=True)
+
+    return entradas
+
+def marcar_esquema_etlsih(estado) -> None:
+    # Marks the partitions of the state as written with VERSAO_ESQUEMA_SIH, an output of its pipeline stage,
+    # so a new version of the schema makes the stage run again (hidden from the *.parquet globs of the readers).
+    pasta = f"""{SILVER_PATH}ETLSIH_parquet/uf={estado}/"""
+
+    os.makedirs(pasta, exist_ok=True)
+
+    for marcador in glob.glob(f"{pasta}_esquema_*"):
+        os.remove(marcador)
+
+    open(f"{pasta}_esquema_{VERSAO_ESQUEMA_SIH}", "w").close()
+
+def ler_etlsih_uf(conn, escopo, estado, forcar=False) -> bool:
+    """
+    [Description]
+
+        Reads the SIHSUS files of one state and records them in the manifest.
+
+    [Source]
+
+        Link: https://bigdata-arquivos.icict.fiocruz.br/PUBLICO/SIH/ETLSIH.zip
+
+    [Goal]
+
+        Ingesting the new or changed months of the state (see ler_etlsih_estado) and merging its entries
+        into ETLSIH_manifest.json, so states can be ingested in parallel.
+        With forcar, every month of the state is ingested again.
+        Returns True when something was ingested.
+
+    """
+
+    os.makedirs(f"""{SILVER_PATH}ETLSIH_parquet""", exist_ok=True)
+
+    with TRAVA_MANIFESTO:
+        manifesto = ler_manifesto_etlsih()
+
+    entradas = ler_etlsih_estado(conn, estado, manifesto, escopo, forcar=forcar)
+
+    alterado = any(manifesto.get(arquivo) != entrada for arquivo, entrada in entradas.items())
+
+    # Other states may have updated the manifest in the meantime.
+    with TRAVA_MANIFESTO:
+        manifesto = ler_manifesto_etlsih()
+        manifesto.update(entradas)
+        gravar_manifesto_etlsih(manifesto)
+
+    marcar_esquema_etlsih(estado)
+
+    return alterado
+
+def ler_etlsih_file(conn, escopo, forcar=False) -> None:
+    """
+    [Description]
+
+        Reads files from the SUS Hospital Information System - SIHSUS.
+        Records with the fields necessary for the analysis.
+    
+    [Source]
+
+        Link: https://bigdata-arquivos.icict.fiocruz.br/PUBLICO/SIH/ETLSIH.zip
+
+    [Goal]
+
+        Reading of all files aggregated by UF, making them available in a hive partitioned .parquet dataset (uf/ano/mes),
+        seeking to obtain better performance in data analysis.
+        Only months that are new or changed since the last run are ingested (see ETLSIH_manifest.json),
+        and states are processed in parallel, using NUMERO_THREADS workers.
+        The gold layer is rebuilt when something was ingested (see gerar_gold).
+    
+    """
+
+    # Each worker uses its own cursor, duckdb connections are not shared between threads.
+    with ThreadPoolExecutor(max_workers=NUMERO_THREADS) as executor:
+        tarefas = [
+            executor.submit(ler_etlsih_uf, conn.cursor(), escopo, estado, forcar)
+            for estado in escopo.ufs
+        ]
+
+        # Propagate errors raised inside the workers.
+        alterado = any([tarefa.result() for tarefa in tarefas])
+
+    if alterado or forcar or not os.path.exists(f"""{GOLD_PATH}sih_mes.parquet"""):
+        gerar_gold(conn, escopo)
+
+def dividir_memoria(limite, partes) -> str:
+    # Splits a duckdb memory limit (e.g. "8GB") in equal parts, in MB.
+    correspondencia = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]I?B)\s*", limite.upper())
+
+    if correspondencia is None:
+        raise ValueError(f"Invalid memory limit: {limite}")
+
+    valor, unidade = correspondencia.groups()
+    fatores = {"KB": 1e3, "MB": 1e6, "GB": 1e9, "TB": 1e12, "KIB": 2**10, "MIB": 2**20, "GIB": 2**30, "TIB": 2**40}
+
+    return f"{max(1, int(float(valor) * fatores[unidade] / partes / 1e6))}MB"
+
+def lotes_etlsih(escopo, processos) -> list:
+    """
+    [Description]
+
+        Splits the ETLSIH files of the scope in batches for the worker processes.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Returning one batch (size in bytes, state, files) per state, and one per year for the states larger than
+        an even share of the work (e.g. SP and MG at national scale), so no batch holds back the pool.
+        Batches are sorted by size, largest first (LPT scheduling): handed out in this order to the first free worker,
+        the longest batches start first and the short ones fill the gaps at the end.
+
+    """
+
+    estados = []
+
+    for estado in escopo.ufs:
+        arquivos = arquivos_etlsih(estado, escopo)
+        estados.append((sum(os.path.getsize(arquivo) for arquivo in arquivos), estado, arquivos))
+
+    limite = sum(tamanho for tamanho, _, _ in estados) / max(1, processos)
+
+    lotes = []
+
+    for tamanho, estado, arquivos in estados:
+
+        if tamanho <= limite:
+            lotes.append((tamanho, estado, arquivos))
+            continue
+
+        por_ano = {}
+        for arquivo in arquivos:
+            por_ano.setdefault(re.search(r"_(\d{4})_\d+_t\.csv$", arquivo).group(1), []).append(arquivo)
+
+        for arquivos_ano in por_ano.values():
+            lotes.append((sum(os.path.getsize(arquivo) for arquivo in arquivos_ano), estado, arquivos_ano))
+
+    return sorted(lotes, key=lambda lote: lote[0], reverse=True)
+
+def ler_etlsih_lote(caminhos, escopo, estado, arquivos, manifesto, limite_memoria, threads, forcar=False) -> dict:
+    """
+    [Description]
+
+        Reads a batch of SIHSUS files in a worker process.
+
+    [Source]
+
+        Link: https://bigdata-arquivos.icict.fiocruz.br/PUBLICO/SIH/ETLSIH.zip
+
+    [Goal]
+
+        Ingesting the batch (see ler_etlsih_estado) with a duckdb connection of the worker, limited to its share
+        of the memory and threads and spilling to its own temporary directory.
+        The manifest is only read: the entries are returned and merged by the main process.
+
+    """
+
+    # Worker processes start without the paths set by the main process.
+    globals().update(caminhos)
+
+    conn = duckdb.connect()
+
+    configurar_conexao(conn, limite_memoria, threads)
+
+    conn.execute(f"SET temp_directory = '{SILVER_PATH}.tmp/{os.getpid()}'")
+
+    escopo.registrar(conn)
+
+    try:
+        return ler_etlsih_estado(conn, estado, manifesto, escopo, arquivos, forcar)
+    finally:
+        conn.close()
+
+def ler_etlsih_nacional(conn, escopo, processos=NUMERO_PROCESSOS, forcar=False) -> bool:
+    """
+    [Description]
+
+        Reads the SIHSUS files of every state of the scope in a pool of processes.
+
+    [Source]
+
+        Link: https://bigdata-arquivos.icict.fiocruz.br/PUBLICO/SIH/ETLSIH.zip
+
+    [Goal]
+
+        Ingesting the national extract on one multi-core machine: the files are split in batches by state and year
+        (see lotes_etlsih), each worker process gets an even share of LIMITE_MEMORIA and NUMERO_THREADS, and the
+        main process merges the manifest entries of the workers. The gold layer is left to the gold stage of the pipeline.
+        Entries of the finished batches are kept even if another batch fails, so a new run only retries the failed ones.
+        With forcar, every file is ingested again.
+        Returns True when something was ingested.
+
+    """
+
+    os.makedirs(f"""{SILVER_PATH}ETLSIH_parquet""", exist_ok=True)
+
+    # Created up front, batches of the same state write their years in parallel.
+    for estado in escopo.ufs:
+        os.makedirs(f"""{SILVER_PATH}ETLSIH_parquet/uf={estado}""", exist_ok=True)
+
+    with TRAVA_MANIFESTO:
+        manifesto = ler_manifesto_etlsih()
+
+    lotes = lotes_etlsih(escopo, processos)
+
+    if not lotes:
+        return False
+
+    processos = max(1, min(processos, len(lotes)))
+    limite_memoria = dividir_memoria(LIMITE_MEMORIA, processos)
+    threads = max(1, NUMERO_THREADS // processos)
+
+    caminhos = {"RAW_PATH": RAW_PATH, "SILVER_PATH": SILVER_PATH, "GOLD_PATH": GOLD_PATH, "LOG_PATH": LOG_PATH}
+
+    print(f"ETLSIH: {len(lotes)} batches, {processos} processes of {limite_memoria} and {threads} threads")
+
+    entradas = {}
+    erros = []
+
+    # spawn: a forked child would inherit the locks of the duckdb threads of the main process.
+    with ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context("spawn")) as executor:
+        tarefas = {
+            executor.submit(ler_etlsih_lote, caminhos, escopo, estado, arquivos, manifesto, limite_memoria, threads, forcar): estado
+            for _, estado, arquivos in lotes
+        }
+
+        for tarefa, estado in tarefas.items():
+            try:
+                entradas.update(tarefa.result())
+            except Exception as e:
+                erros.append(f"{estado}: {e}")
+
+    with TRAVA_MANIFESTO:
+        manifesto = ler_manifesto_etlsih()
+        alterado = any(manifesto.get(arquivo) != entrada for arquivo, entrada in entradas.items())
+        manifesto.update(entradas)
+        gravar_manifesto_etlsih(manifesto)
+
+    if erros:
+        raise RuntimeError(f"ETLSIH batches failed: {'; '.join(erros)}")
+
+    for estado in escopo.ufs:
+        marcar_esquema_etlsih(estado)
+
+    return alterado
+
+def gerar_dim_cid10(conn) -> None:
+    """
+    [Description]
+
+        Builds the ICD-10 dimension.
+
+    [Source]
+
+        Link: https://www.datasus.gov.br/cid10/V2008/cid10.htm
+
+    [Goal]
+
+        Writing one row per ICD-10 category code (A00 to Z99, see codigo_cid10) with its text code, chapter and,
+        for the external causes, group (the code of the first category of the group), with their names.
+        The silver and gold layers keep only the integer codes and join this table for the labels.
+
+    """
+
+    capitulos = ",\n".join(
+        f"({codigo_cid10(inicio)}, {codigo_cid10(fim)}, {numero}, '{nome}')"
+        for numero, (inicio, fim, nome) in enumerate(CAPITULOS_CID10, start=1)
+    )
+
+    grupos = ",\n".join(
+        f"({codigo_cid10(inicio)}, {codigo_cid10(fim)}, '{nome}')" for inicio, fim, nome in GRUPOS_CAUSAS_EXTERNAS
+    )
+
+    exportar_parquet(conn, f"""
+        WITH capitulos (inicio, fim, capitulo, nome) AS (VALUES {capitulos}),
+        grupos (inicio, fim, nome) AS (VALUES {grupos})
+        SELECT CAST(c.categoria AS SMALLINT) AS categoria,
+               chr(65 + CAST(c.categoria // 100 AS INTEGER)) || lpad(CAST(c.categoria % 100 AS VARCHAR), 2, '0') AS codigo,
+               CAST(cap.capitulo AS TINYINT) AS capitulo,
+               cap.nome AS nome_capitulo,
+               CAST(g.inicio AS SMALLINT) AS grupo,
+               g.nome AS nome_grupo
+        FROM range(0, 2600) c(categoria)
+        LEFT JOIN capitulos cap ON c.categoria BETWEEN cap.inicio AND cap.fim
+        LEFT JOIN grupos g ON c.categoria BETWEEN g.inicio AND g.fim
+        ORDER BY c.categoria
+    """, f"""{SILVER_PATH}dim_cid10.parquet""")
+
+def gerar_gold(conn, escopo) -> None:
+    """
+    [Description]
+
+        Builds the gold layer of the SUS Hospital Information System - SIHSUS.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Pre-aggregating the ETLSIH silver layer once, so reports read kilobytes instead of every record:
+
+            sih_cubo.parquet: hospitalizations, deaths and sum/mean of the values (VAL_*) by state, municipality,
+                              year, month, sex, age group, ICD chapter of the main diagnosis (capitulo_principal)
+                              and external cause group of the secondary diagnosis (grupo_causa, see dim_cid10).
+            sih_mes.parquet:  the same measures by state, municipality, year and month, for the traffic accidents
+                              (CID10_TRANSITO) only.
+
+        Sums and counts add up, so any rollup (e.g. by state or year) is computed from these files,
+        means of a rollup are the sum of the value divided by the hospitalizations.
+        Only the partitions of the states, years and municipalities of the scope are read, so partitions left
+        by an ingestion with a wider scope never reach the reports.
+
+    """
+
+    os.makedirs(GOLD_PATH, exist_ok=True)
+
+    gerar_dim_cid10(conn)
+
+    # Sum and mean of each value.
+    somas = ",\n".join(
+        f"sum({valor}) AS {valor.lower()}_soma, avg({valor}) AS {valor.lower()}_media" for valor in VALORES_SIH
+    )
+
+    conn.execute(f"""COPY (SELECT s.uf,
+                                 s.int_MUNCOD AS cod_sih,
+                                 s.int_MUNNOME,
+                                 s.ano,
+                                 s.mes,
+                                 s.def_sexo,
+                                 s.def_idade_pub,
+                                 principal.capitulo AS capitulo_principal,
+                                 secundario.grupo AS grupo_causa,
+                                 count(*) AS internacoes,
+                                 count(*) FILTER (WHERE s.def_morte <> 'Sem óbito') AS obitos,
+                                 {somas}
+                          FROM read_parquet('{SILVER_PATH}ETLSIH_parquet/*/*/*/*.parquet', union_by_name = true, hive_partitioning = true) s
+                          LEFT JOIN read_parquet('{SILVER_PATH}dim_cid10.parquet') principal ON principal.categoria = s.cid_principal
+                          LEFT JOIN read_parquet('{SILVER_PATH}dim_cid10.parquet') secundario ON secundario.categoria = s.cid_secundario
+                          WHERE s.uf IN (SELECT sigla FROM escopo_uf)
+                            AND s.ano BETWEEN {escopo.ano_inicial} AND {escopo.ano_final}
+                            AND {escopo.filtro("s.int_MUNCOD", sih=True)}
+                          GROUP BY ALL
+                          ORDER BY uf, cod_sih, ano, mes)
+                     TO '{GOLD_PATH}sih_cubo.parquet' (FORMAT PARQUET, COMPRESSION SNAPPY);""")
+
+    # Rollup of the traffic accidents of the cube by municipality and month, means recomputed from the sums.
+    somas = ",\n".join(
+        f"sum({valor.lower()}_soma) AS {valor.lower()}_soma, sum({valor.lower()}_soma) / sum(internacoes) AS {valor.lower()}_media"
+        for valor in VALORES_SIH
+    )
+
+    conn.execute(f"""COPY (SELECT uf,
+                                 cod_sih,
+                                 int_MUNNOME,
+                                 ano,
+                                 mes,
+                                 CAST(sum(internacoes) AS BIGINT) AS internacoes,
+                                 CAST(sum(obitos) AS BIGINT) AS obitos,
+                                 {somas}
+                          FROM read_parquet('{GOLD_PATH}sih_cubo.parquet')
+                          WHERE grupo_causa BETWEEN {CID10_TRANSITO[0]} AND {CID10_TRANSITO[1]}
+                          GROUP BY ALL
+                          ORDER BY uf, cod_sih, ano, mes)
+                     TO '{GOLD_PATH}sih_mes.parquet' (FORMAT PARQUET, COMPRESSION SNAPPY);""")
+
+def query_metricas(origem, indicadores, chave="cod_ibge", populacao=None) -> str:
+    """
+    [Description]
+
+        Builds the query of the time series metrics of indicators by municipality and year.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Adding to every row of origem (a table, view or subquery with one row per municipality and year),
+        for each indicator, with duckdb window functions partitioned by municipality and ordered by year:
+
+            {indicador}_CRESCIMENTO:   growth over the previous year, null when that year is missing or zero.
+            {indicador}_MEDIA_3_ANOS:  mean of the year and the two previous years present.
+            {indicador}_CAGR:          compound annual growth between the first and last years of the municipality.
+            {indicador}_POR_100K:      value per 100 thousand inhabitants, when the population column is given.
+
+        Rows may come in any order and no Python loop runs per municipality, so it scales to every municipality.
+
+    """
+
+    colunas = []
+
+    for indicador in indicadores:
+
+        atual = f'"{indicador}"'
+
+        colunas.append(
+            f"""CASE WHEN lag(ano) OVER anual = ano - 1
+                     THEN {atual} / NULLIF(lag({atual}) OVER anual, 0) - 1
+                END AS "{indicador}_CRESCIMENTO" """
+        )
+        colunas.append(f'avg({atual}) OVER tres_anos AS "{indicador}_MEDIA_3_ANOS"')
+        colunas.append(
+            f"""CASE WHEN first_value({atual}) OVER periodo > 0 AND last_value({atual}) OVER periodo > 0
+                          AND last_value(ano) OVER periodo > first_value(ano) OVER periodo
+                     THEN pow(last_value({atual}) OVER periodo / first_value({atual}) OVER periodo,
+                              1 / (last_value(ano) OVER periodo - first_value(ano) OVER periodo)) - 1
+                END AS "{indicador}_CAGR" """
+        )
+
+        if populacao is not None and indicador != populacao:
+            colunas.append(f'{atual} / NULLIF("{populacao}", 0) * 100000 AS "{indicador}_POR_100K"')
+
+    colunas_metricas = ",\n".join(colunas)
+
+    return f"""
+        SELECT *, {colunas_metricas}
+        FROM {origem}
+        WINDOW anual AS (PARTITION BY {chave} ORDER BY ano),
+               tres_anos AS (PARTITION BY {chave} ORDER BY ano RANGE BETWEEN 2 PRECEDING AND CURRENT ROW),
+               periodo AS (PARTITION BY {chave} ORDER BY ano ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)
+    """
+
+"""
+
+Reports performed by analise, expressed as duckdb SQL over the catalog (see atualizar_catalogo).
+Each report has a title and a query. Hospitalizations are read from the gold layer (see gerar_gold),
+counts are aggregated before the joins and the growth rates, rates per inhabitant and moving averages
+come from query_metricas, over one row per municipality and year.
+Datasets join through dim_municipio, on the integer keys cod_ibge (IBGE) and cod_sih (SIH).
+
+"""
+RELATORIOS = {
+
+    # Data analyze from SIMU files - Motorization - Evolutionary Fleet vs data from ETLSIH.
+    # Study of the increase in rates and hospitalizations caused by traffic accidents for municipalities
+    # of Rio de Janeiro, São Paulo and the Federal District by population size.
+    "sih_frota": (
+        "Analysis of ETLSIH data (Hospital Data) x Fleet and Population",
+        f"""
+        WITH internacoes AS (
+            SELECT cod_sih, ano, CAST(sum(internacoes) AS BIGINT) AS TOTAL_INTERNACOES
+            FROM sih_mes
+            GROUP BY cod_sih, ano
+        ),
+        base AS (
+            SELECT d.cod_ibge,
+                   d.nome AS "Município",
+                   i.ano,
+                   f.TOTAL_VEICULOS,
+                   f.Populacao,
+                   i.TOTAL_INTERNACOES
+            FROM internacoes i
+            JOIN dim_municipio d ON d.cod_sih = i.cod_sih
+            JOIN frota f ON f.cod_ibge = d.cod_ibge AND f.ano = i.ano
+        )
+        SELECT "Município",
+               ano,
+               TOTAL_VEICULOS,
+               Populacao,
+               TOTAL_INTERNACOES,
+               TOTAL_INTERNACOES / NULLIF(Populacao, 0) * 100 AS TAXA_INTERNACOES_POPULACAO,
+               Populacao_CRESCIMENTO AS PERCENTUAL_AUMENTO_POPULACAO,
+               TOTAL_INTERNACOES_POR_100K,
+               TOTAL_INTERNACOES_MEDIA_3_ANOS,
+               TOTAL_INTERNACOES_CAGR
+        FROM ({query_metricas("base", ["Populacao", "TOTAL_INTERNACOES"], populacao="Populacao")})
+        ORDER BY "Município", ano
+        """,
+    ),
+
+    # Analysis of accident data from IPEA and SIMU x Frota.
+    # Study of the increase in deaths/injuries per number of vehicles/population and accident rate per population
+    # for the municipalities of Rio de Janeiro, São Paulo and the Federal District.
+    "acidentes_frota": (
+        "Analysis of accident data from IPEA and SIMU x Frota",
+        f"""
+        WITH acidentes_ano AS (
+            -- The SIMU file repeats some municipality-years (identical rows), query_metricas needs one row each.
+            SELECT cod_ibge, ano, max(total_mortes) AS total_mortes, max(total_feridos) AS total_feridos
+            FROM acidentes
+            GROUP BY cod_ibge, ano
+        ),
+        base AS (
+            SELECT a.cod_ibge,
+                   d.cod_sih,
+                   d.nome AS "Município",
+                   a.ano,
+                   f.TOTAL_VEICULOS,
+                   f.Populacao AS Populacao_y,
+                   a.total_mortes,
+                   a.total_feridos,
+                   a.total_mortes + a.total_feridos AS TOTAL_DE_ACIDENTES
+            FROM acidentes_ano a
+            JOIN dim_municipio d ON d.cod_ibge = a.cod_ibge
+            JOIN frota f ON f.cod_ibge = a.cod_ibge AND f.ano = a.ano
+        )
+        SELECT cod_sih,
+               "Município",
+               ano,
+               TOTAL_VEICULOS,
+               Populacao_y,
+               total_mortes,
+               total_feridos,
+               TOTAL_DE_ACIDENTES,
+               total_mortes / NULLIF(total_feridos, 0) * 100 AS TAXA_FERIDOS_MORTES,
+               TOTAL_VEICULOS / NULLIF(Populacao_y, 0) * 100 AS TAXA_POPULACAO_VEICULOS,
+               TOTAL_DE_ACIDENTES / NULLIF(Populacao_y, 0) * 100 AS TAXA_ACIDENTES_POPULACAO,
+               TOTAL_DE_ACIDENTES_CRESCIMENTO AS PERCENTUAL_AUMENTO_ACIDENTES,
+               total_mortes_POR_100K,
+               TOTAL_DE_ACIDENTES_POR_100K,
+               TOTAL_DE_ACIDENTES_MEDIA_3_ANOS,
+               TOTAL_DE_ACIDENTES_CAGR
+        FROM ({query_metricas("base", ["total_mortes", "TOTAL_DE_ACIDENTES"], populacao="Populacao_y")})
+        ORDER BY "Município", ano
+        """,
+    ),
+
+    # Analysis of ETLSIH data (Hospital Data) x Enterprise Portfolio.
+    # Study of the increase in hospitalizations for the municipalities of Rio de Janeiro, São Paulo and the Federal District
+    # associated with the portfolio of projects.
+    # Growth is calculated over every year of hospitalizations, before keeping the years with works.
+    "sih_carteira": (
+        "Analysis of ETLSIH data (Hospital Data) x Enterprise Portfolio",
+        f"""
+        WITH obras AS (
+            SELECT cod_ibge, CAST(ano_fim_obra AS INTEGER) AS ano, count(*) AS TOTAL_OBRAS
+            FROM carteira
+            WHERE cod_ibge IS NOT NULL AND ano_fim_obra IS NOT NULL
+            GROUP BY ALL
+        ),
+        internacoes AS (
+            SELECT cod_sih, ano, CAST(sum(internacoes) AS BIGINT) AS TOTAL_INTERNACOES
+            FROM sih_mes
+            GROUP BY cod_sih, ano
+        )
+        SELECT i.cod_sih,
+               i.ano,
+               d.nome AS "Município",
+               i.TOTAL_INTERNACOES,
+               o.TOTAL_OBRAS,
+               i.TOTAL_INTERNACOES_CRESCIMENTO AS PERCENTUAL_AUMENTO_INTERNACOES,
+               i.TOTAL_INTERNACOES_MEDIA_3_ANOS
+        FROM ({query_metricas("internacoes", ["TOTAL_INTERNACOES"], chave="cod_sih")}) i
+        JOIN dim_municipio d ON d.cod_sih = i.cod_sih
+        JOIN obras o ON o.cod_ibge = d.cod_ibge AND o.ano = i.ano
+        ORDER BY d.nome, i.ano
+        """,
+    ),
+}
+
+def fontes_catalogo() -> dict:
+    """
+    [Description]
+
+        Returns the sources of the catalog objects.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Mapping each catalog object (acidentes, carteira, frota, sih, the municipality and ICD-10 dimensions and the gold cubes)
+        to the .parquet files it reads and to the query that builds it, with the integer municipality key
+        (cod_ibge for the SIMU files, cod_sih for the SIH files) already computed.
+
+    """
+
+    return {
+        "acidentes": (
+            f"""{SILVER_PATH}acidentes-geral.parquet""",
+            f"""SELECT *, CAST(cod AS INTEGER) AS cod_ibge FROM read_parquet('{SILVER_PATH}acidentes-geral.parquet')""",
+        ),
+        "carteira": (
+            f"""{SILVER_PATH}simu-carteira-mun-T.parquet""",
+            f"""SELECT *, CAST("Código IBGE" AS INTEGER) AS cod_ibge FROM read_parquet('{SILVER_PATH}simu-carteira-mun-T.parquet')""",
+        ),
+        "frota": (
+            f"""{SILVER_PATH}simu-frota-mun_T.parquet""",
+            f"""SELECT *, CAST("Código IBGE" AS INTEGER) AS cod_ibge FROM read_parquet('{SILVER_PATH}simu-frota-mun_T.parquet')""",
+        ),
+        "dim_municipio": (
+            f"""{SILVER_PATH}dim_municipio.parquet""",
+            f"""SELECT * FROM read_parquet('{SILVER_PATH}dim_municipio.parquet')""",
+        ),
+        "dim_cid10": (
+            f"""{SILVER_PATH}dim_cid10.parquet""",
+            f"""SELECT * FROM read_parquet('{SILVER_PATH}dim_cid10.parquet')""",
+        ),
+        # Hive partitioned dataset (uf/ano/mes): filters on uf, ano and mes skip whole partitions
+        # and filters on int_MUNCOD skip row groups through the parquet min/max statistics.
+        "sih": (
+            f"""{SILVER_PATH}ETLSIH_parquet/*/*/*/*.parquet""",
+            f"""SELECT *, CAST(int_MUNCOD AS INTEGER) AS cod_sih
+                FROM read_parquet('{SILVER_PATH}ETLSIH_parquet/*/*/*/*.parquet', union_by_name = true, hive_partitioning = true)""",
+        ),
+        "sih_cubo": (
+            f"""{GOLD_PATH}sih_cubo.parquet""",
+            f"""SELECT * FROM read_parquet('{GOLD_PATH}sih_cubo.parquet')""",
+        ),
+        "sih_mes": (
+            f"""{GOLD_PATH}sih_mes.parquet""",
+            f"""SELECT * FROM read_parquet('{GOLD_PATH}sih_mes.parquet')""",
+        ),
+    }
+
+def impressao_arquivos(padrao) -> str:
+    """
+    [Description]
+
+        Calculates the fingerprint of the files matching a pattern.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Detecting changes in the silver layer from the name, size and mtime of each file, without reading them.
+
+    """
+
+    sha = hashlib.sha256()
+
+    for caminho in sorted(glob.glob(padrao)):
+        info = os.stat(caminho)
+        sha.update(f"{caminho}|{info.st_size}|{info.st_mtime_ns}\n".encode())
+
+    return sha.hexdigest()
+
+def atualizar_catalogo(conn, objetos=None) -> None:
+    """
+    [Description]
+
+        Creates or refreshes the catalog of the silver layer in duckdb.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Registering acidentes, carteira, frota, dim_municipio, dim_cid10, sih, sih_cubo and sih_mes, used by the reports,
+        or only the objects given (e.g. those read by the reports to run, see objetos_relatorio).
+        In a database file (--catalogo) they are typed tables, kept between runs and rebuilt only when
+        their query or the fingerprint of their .parquet files changes (see catalogo_versao), so repeated runs
+        start warm.
+        In memory they are views over the .parquet files, so nothing is read until a query runs.
+
+    """
+
+    persistente = conn.execute(
+        "SELECT path IS NOT NULL FROM duckdb_databases() WHERE database_name = current_database()"
+    ).fetchone()[0]
+
+    conn.execute("CREATE TABLE IF NOT EXISTS catalogo_versao (objeto VARCHAR PRIMARY KEY, impressao VARCHAR)")
+
+    for objeto, (padrao, query) in fontes_catalogo().items():
+
+        if objetos is not None and objeto not in objetos:
+            continue
+
+        if not glob.glob(padrao):
+            print(f"Error: no files found for {objeto} ({padrao})")
+            continue
+
+        if not persistente:
+            conn.execute(f"CREATE OR REPLACE VIEW {objeto} AS {query}")
+            continue
+
+        # The query is part of the version, so a changed definition rebuilds the table even over the same files.
+        impressao = hashlib.sha256(f"{query}\n{impressao_arquivos(padrao)}".encode()).hexdigest()
+
+        versao = conn.execute("SELECT impressao FROM catalogo_versao WHERE objeto = ?", [objeto]).fetchone()
+
+        # Query and files unchanged since the table was built.
+        if versao is not None and versao[0] == impressao:
+            continue
+
+        print(f"Catalog: refreshing {objeto}")
+
+        conn.execute(f"CREATE OR REPLACE TABLE {objeto} AS {query}")
+        conn.execute("INSERT OR REPLACE INTO catalogo_versao VALUES (?, ?)", [objeto, impressao])
+
+"""
+
+Municipality key of each catalog object, checked against dim_municipio before the reports.
+
+"""
+CHAVES_MUNICIPIO = {
+    "acidentes": "cod_ibge",
+    "carteira": "cod_ibge",
+    "frota": "cod_ibge",
+    "sih_mes": "cod_sih",
+}
+
+def verificar_chaves(conn, objetos=None) -> dict:
+    """
+    [Description]
+
+        Checks the municipality keys of the catalog.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Detecting the codes of each dataset missing from dim_municipio, which an inner join would drop silently,
+        and SIH codes shared by more than one IBGE code, which would duplicate rows.
+        Only the objects given are checked (every object by default).
+        Returns the missing codes by catalog object.
+
+    """
+
+    existentes = {linha[0] for linha in conn.execute("SELECT table_name FROM duckdb_tables() UNION ALL SELECT view_name FROM duckdb_views()").fetchall()}
+
+    if "dim_municipio" not in existentes:
+        print("Error: dim_municipio not found in the catalog")
+        return {}
+
+    ausentes = {}
+
+    for objeto, chave in CHAVES_MUNICIPIO.items():
+
+        if objeto not in existentes or (objetos is not None and objeto not in objetos):
+            continue
+
+        codigos = [linha[0] for linha in conn.execute(f"""
+            SELECT DISTINCT o.{chave}
+            FROM {objeto} o
+            ANTI JOIN dim_municipio d ON d.{chave} = o.{chave}
+            WHERE o.{chave} IS NOT NULL
+            ORDER BY 1
+        """).fetchall()]
+
+        if codigos:
+            print(f"Warning: {len(codigos)} codes of {objeto} not found in dim_municipio: {codigos[:10]}")
+            ausentes[objeto] = codigos
+
+    repetidos = conn.execute("SELECT cod_sih FROM dim_municipio GROUP BY cod_sih HAVING count(*) > 1").fetchall()
+
+    if repetidos:
+        print(f"Warning: SIH codes shared by more than one municipality in dim_municipio: {[linha[0] for linha in repetidos[:10]]}")
+
+    return ausentes
+
+def objetos_relatorio(query) -> list:
+    # Catalog objects (see fontes_catalogo) read by the query of a report.
+    return [objeto for objeto in fontes_catalogo() if re.search(rf"\b{objeto}\b", query)]
+
+"""
+
+Stages writing the files of each catalog object (patterns of stage names, see carimbo_etapa)
+and the source of the ingest command running them (see GRUPOS_ETAPAS).
+
+"""
+ETAPAS_CATALOGO = {
+    "acidentes": ("acidentes", "simu"),
+    "carteira": ("carteira", "simu"),
+    "frota": ("frota", "simu"),
+    "dim_municipio": ("dim_municipio", "simu"),
+    "dim_cid10": ("gold", "etlsih"),
+    "sih": ("etlsih_*", "etlsih"),
+    "sih_cubo": ("gold", "etlsih"),
+    "sih_mes": ("gold", "etlsih"),
+}
+
+def verificar_entradas(objetos, escopo=None) -> None:
+    """
+    [Description]
+
+        Checks the input files of the reports.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Stopping before the reports, with the ingest command to run, when the files of a catalog object are missing
+        or, with escopo, were written by a stage run with another scope (see carimbo_etapa),
+        instead of failing inside duckdb or reporting the data of another scope.
+        Raises a RuntimeError with every problem found.
+
+    """
+
+    fontes = fontes_catalogo()
+    problemas = []
+
+    for objeto in objetos:
+        padrao = fontes[objeto][0]
+        etapas, fonte = ETAPAS_CATALOGO[objeto]
+
+        if not glob.glob(padrao):
+            problemas.append(f"no files found for {objeto} ({padrao}), run 'ingest {fonte}' first")
+            continue
+
+        if escopo is None:
+            continue
+
+        for carimbo in glob.glob(f"""{SILVER_PATH}.etapas/{etapas}.json"""):
+            with open(carimbo, encoding="utf-8") as arquivo:
+                if json.load(arquivo) != escopo.carimbo():
+                    problemas.append(f"{objeto} was written with another scope, run 'ingest {fonte}' with this scope first")
+                    break
+
+    if problemas:
+        raise RuntimeError("; ".join(dict.fromkeys(problemas)))
+
+def chave_relatorio(query, escopo=None) -> str:
+    """
+    [Description]
+
+        Calculates the cache key of a report.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Identifying a report result by its query, the scope, and the definitions and fingerprints (see
+        impressao_arquivos) of the .parquet files of the catalog objects the query reads, so any change of one of
+        them gives a new key.
+
+    """
+
+    sha = hashlib.sha256(query.encode())
+
+    if escopo is not None:
+        sha.update(f"{escopo.chave()}|{escopo.ano_inicial}|{escopo.ano_final}".encode())
+
+    fontes = fontes_catalogo()
+
+    for objeto in objetos_relatorio(query):
+        padrao, definicao = fontes[objeto]
+        sha.update(f"{objeto}|{definicao}|{impressao_arquivos(padrao)}".encode())
+
+    return sha.hexdigest()
+
+def ler_cache_relatorio(chave):
+    """
+    [Description]
+
+        Reads a report result from the cache.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Returning the arrow table cached under the key, or None. The mtime of the file is updated on each hit,
+        so the eviction (see gravar_cache_relatorio) removes the least recently used results.
+
+    """
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    caminho = f"""{CACHE_RELATORIOS_PATH}{chave}.parquet"""
+
+    try:
+        tabela = pq.read_table(caminho)
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return None
+
+    os.utime(caminho)
+
+    return tabela
+
+def gravar_cache_relatorio(chave, tabela) -> None:
+    """
+    [Description]
+
+        Writes a report result to the cache.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Writing the arrow table as a .parquet file named after the key, then removing the least recently used
+        results while the cache is larger than TAMANHO_CACHE_RELATORIOS.
+
+    """
+
+    import pyarrow.parquet as pq
+
+    os.makedirs(CACHE_RELATORIOS_PATH, exist_ok=True)
+
+    caminho = f"""{CACHE_RELATORIOS_PATH}{chave}.parquet"""
+
+    pq.write_table(tabela, f"{caminho}.tmp")
+    os.replace(f"{caminho}.tmp", caminho)
+
+    arquivos = sorted(
+        (os.stat(arquivo).st_mtime_ns, os.path.getsize(arquivo), arquivo)
+        for arquivo in glob.glob(f"""{CACHE_RELATORIOS_PATH}*.parquet""")
+    )
+
+    tamanho = sum(tamanho for _, tamanho, _ in arquivos)
+
+    for _, tamanho_arquivo, arquivo in arquivos:
+
+        if tamanho <= TAMANHO_CACHE_RELATORIOS or arquivo == caminho:
+            break
+
+        os.remove(arquivo)
+        tamanho -= tamanho_arquivo
+
+def analise(conn, escopo=None, cache=True, relatorios=None) -> dict:
+    """
+    [Description]
+
+        Performing data analysis.
+    
+    [Source]
+
+        None
+
+    [Goal]
+
+        Running the reports of RELATORIOS (all of them, or only the names in relatorios) inside duckdb,
+        over the catalog of the silver layer.
+        Only the final results are materialised, as arrow tables, and converted to pandas for printing only.
+        Results are cached on disk (see chave_relatorio), so a report whose query, scope and input files did not
+        change is read back instead of computed, and the catalog objects read by a report are only refreshed
+        when it must run.
+        The input files are checked first (see verificar_entradas).
+        Returns the arrow tables by report name, which duckdb can query in place.
+    
+    """
+
+    resultados = {}
+    atualizados = set()
+
+    relatorios = relatorios or list(RELATORIOS)
+
+    verificar_entradas(
+        list(dict.fromkeys(objeto for nome in relatorios for objeto in objetos_relatorio(RELATORIOS[nome][1]))), escopo
+    )
+
+    for nome in relatorios:
+
+        titulo, query = RELATORIOS[nome]
+
+        chave = chave_relatorio(query, escopo)
+
+        resultados[nome] = ler_cache_relatorio(chave) if cache else None
+
+        if resultados[nome] is None:
+
+            # Only the objects read by the report, the others may be large (e.g. sih) and are not needed.
+            objetos = [objeto for objeto in objetos_relatorio(query) if objeto not in atualizados]
+
+            if objetos:
+                atualizar_catalogo(conn, objetos)
+                verificar_chaves(conn, objetos)
+                atualizados.update(objetos)
+
+            resultados[nome] = conn.execute(query).fetch_arrow_table()
+
+            if cache:
+                gravar_cache_relatorio(chave, resultados[nome])
+
+        print(titulo)
+        print(resultados[nome].to_pandas())
+
+    return resultados
+
+@dataclass
+class Etapa:
+    """
+    [Description]
+
+        Stage of the pipeline.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Declaring a reader with the files it reads (entradas) and writes (saidas), as glob patterns,
+        and the stages it depends on. A stage is skipped when all its outputs are newer than its inputs
+        and were written with the current scope (see etapa_atualizada).
+
+    """
+
+    nome: str
+    funcao: object
+    entradas: list
+    saidas: list
+    dependencias: list = field(default_factory=list)
+
+def etapas_pipeline(escopo, baixar=False, processos=None, forcar=False, descartar=False) -> list:
+    """
+    [Description]
+
+        Declares the stages of the pipeline.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Listing every reader, from the raw files to the reports: IPEA, SIMU (accidents, portfolio and fleet),
+        the municipality dimension, one ETLSIH stage per state of the scope, the gold layer and the analysis.
+        With baixar, one acquisition stage per archive of FONTES runs before the readers of its files,
+        deleting each archive once extracted with descartar (see adquirir_fonte).
+        With processos (national mode), the ETLSIH files of every state are read by one stage with a pool of
+        processes (see ler_etlsih_nacional).
+        With forcar, the ETLSIH stages ingest every file again instead of only the new or changed ones.
+
+    """
+
+    etapas = [
+        Etapa("ipea", ler_acidentes_IPEA,
+              [f"""{RAW_PATH}IPEA/*.csv"""],
+              [f"""{SILVER_PATH}acidentes-IPEA.parquet"""]),
+        Etapa("acidentes", ler_acidentes,
+              [f"""{RAW_PATH}SIMU - Acidentes de Transportes/*.csv""", f"""{SILVER_PATH}acidentes-IPEA.parquet"""],
+              [f"""{SILVER_PATH}acidentes-geral.parquet"""],
+              ["ipea"]),
+        Etapa("carteira", ler_carteira,
+              [f"""{RAW_PATH}simu-carteira-mun-T.csv"""],
+              [f"""{SILVER_PATH}simu-carteira-mun-T.parquet"""]),
+        Etapa("frota", ler_frotas,
+              [f"""{RAW_PATH}simu-frota-mun_T.csv"""],
+              [f"""{SILVER_PATH}simu-frota-mun_T.parquet"""]),
+        Etapa("dim_municipio", lambda conn, escopo: gerar_dim_municipio(conn),
+              [f"""{SILVER_PATH}simu-frota-mun_T.parquet""", f"""{SILVER_PATH}acidentes-geral.parquet""", f"""{SILVER_PATH}simu-carteira-mun-T.parquet"""],
+              [f"""{SILVER_PATH}dim_municipio.parquet"""],
+              ["acidentes", "carteira", "frota"]),
+    ]
+
+    if processos:
+        etapas.append(
+            Etapa("etlsih_nacional", lambda conn, escopo: ler_etlsih_nacional(conn, escopo, processos, forcar),
+                  [f"""{RAW_PATH}ETLSIH/ETLSIH.ST_*_t.csv"""],
+                  [f"""{SILVER_PATH}ETLSIH_parquet/*/*/*/*.parquet"""]
+                  + [f"""{SILVER_PATH}ETLSIH_parquet/uf={estado}/_esquema_{VERSAO_ESQUEMA_SIH}""" for estado in escopo.ufs])
+        )
+        etlsih = ["etlsih_nacional"]
+    else:
+        for estado in escopo.ufs:
+            etapas.append(
+                Etapa(f"etlsih_{estado}", lambda conn, escopo, estado=estado: ler_etlsih_uf(conn, escopo, estado, forcar),
+                      [f"""{RAW_PATH}ETLSIH/ETLSIH.ST_{estado}_*_t.csv"""],
+                      [f"""{SILVER_PATH}ETLSIH_parquet/uf={estado}/*/*/*.parquet""",
+                       f"""{SILVER_PATH}ETLSIH_parquet/uf={estado}/_esquema_{VERSAO_ESQUEMA_SIH}"""])
+            )
+        etlsih = [f"etlsih_{estado}" for estado in escopo.ufs]
+
+    etapas.append(
+        Etapa("gold", lambda conn, escopo: gerar_gold(conn, escopo),
+              [f"""{SILVER_PATH}ETLSIH_parquet/*/*/*/*.parquet"""],
+              [f"""{GOLD_PATH}sih_cubo.parquet""", f"""{GOLD_PATH}sih_mes.parquet""", f"""{SILVER_PATH}dim_cid10.parquet"""],
+              etlsih)
+    )
+
+    # Without outputs, the analysis always runs.
+    etapas.append(
+        Etapa("analise", lambda conn, escopo: analise(conn, escopo),
+              [],
+              [],
+              ["acidentes", "carteira", "frota", "dim_municipio", "gold"])
+    )
+
+    if baixar:
+        # Each reader waits for the acquisition of its archive.
+        for etapa in etapas:
+            fonte = "etlsih" if etapa.nome.startswith("etlsih_") else etapa.nome
+
+            if fonte in FONTES:
+                etapa.dependencias.append(f"baixar_{fonte}")
+
+        # Without inputs, acquisition stages always run, the cache keeps them cheap.
+        etapas = [
+            Etapa(f"baixar_{fonte}", lambda conn, escopo, fonte=fonte: adquirir_fonte(fonte, escopo, descartar),
+                  [],
+                  [f"""{RAW_PATH}{pasta}{padrao}"""])
+            for fonte, (_, pasta, padrao) in FONTES.items()
+        ] + etapas
+
+    return etapas
+
+"""
+
+Stages run by each source of the ingest command, as patterns of stage names (see selecionar_etapas).
+
+"""
+GRUPOS_ETAPAS = {
+    "etlsih": ["etlsih_*", "gold"],
+    "simu": ["acidentes", "carteira", "frota", "dim_municipio"],
+    "ipea": ["ipea"],
+}
+
+def selecionar_etapas(etapas, padroes) -> list:
+    """
+    [Description]
+
+        Selects stages of the pipeline.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Returning the stages whose names match the patterns, plus the stages they depend on (transitively),
+        in the original order, so part of the pipeline can run without the unrelated stages.
+
+    """
+
+    por_nome = {etapa.nome: etapa for etapa in etapas}
+
+    selecionadas = set()
+    pendentes = [nome for nome in por_nome if any(fnmatch.fnmatch(nome, padrao) for padrao in padroes)]
+
+    while pendentes:
+        nome = pendentes.pop()
+
+        if nome in selecionadas:
+            continue
+
+        selecionadas.add(nome)
+        pendentes.extend(por_nome[nome].dependencias)
+
+    return [etapa for etapa in etapas if etapa.nome in selecionadas]
+
+def carimbo_etapa(etapa) -> str:
+    # Stamp written after each run of a stage, with the scope of its outputs (see Escopo.carimbo).
+    return f"""{SILVER_PATH}.etapas/{etapa.nome}.json"""
+
+def gravar_carimbo_etapa(etapa, escopo) -> None:
+    # Written through a temporary file, an interrupted run never leaves a stamp of outputs not written.
+    caminho = carimbo_etapa(etapa)
+
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+
+    with open(f"""{caminho}.tmp""", "w", encoding="utf-8") as arquivo:
+        json.dump(escopo.carimbo(), arquivo, sort_keys=True)
+
+    os.replace(f"""{caminho}.tmp""", caminho)
+
+def etapa_atualizada(etapa, escopo) -> bool:
+    """
+    [Description]
+
+        Checks if the outputs of a stage are up to date.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Comparing the mtime of the files matching the inputs and outputs of the stage, and the scope of the
+        last run of the stage (see carimbo_etapa) with the current scope, so a change of states, municipalities
+        or years runs the stage again. A stage with an output pattern matching no file is not up to date.
+
+    """
+
+    entradas = [caminho for padrao in etapa.entradas for caminho in glob.glob(padrao)]
+    saidas = [caminho for padrao in etapa.saidas for caminho in glob.glob(padrao)]
+
+    if not entradas or not saidas or any(not glob.glob(padrao) for padrao in etapa.saidas):
+        return False
+
+    try:
+        with open(carimbo_etapa(etapa), encoding="utf-8") as arquivo:
+            if json.load(arquivo) != escopo.carimbo():
+                return False
+    except (FileNotFoundError, json.JSONDecodeError):
+        return False
+
+    return max(map(os.path.getmtime, entradas)) <= min(map(os.path.getmtime, saidas))
+
+def linhas_lidas(perfil) -> int:
+    """
+    [Description]
+
+        Sums the rows read by the scans of a duckdb profile.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Counting the rows read by a stage from the json profiling output of its last query.
+
+    """
+
+    linhas = 0
+    operador = perfil.get("name", "")
+
+    if operador.startswith("READ_") or (operador.endswith("_SCAN") and operador != "DUMMY_SCAN"):
+        linhas += perfil.get("cardinality", 0)
+
+    for filho in perfil.get("children", []):
+        linhas += linhas_lidas(filho)
+
+    return linhas
+
+def rss_atual() -> float:
+    # Current RSS of the process in MB, from /proc on linux, or the peak so far (ru_maxrss, in bytes on macOS) elsewhere.
+    try:
+        with open("/proc/self/statm", encoding="utf-8") as arquivo:
+            return int(arquivo.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+def executar_etapa(conn, escopo, etapa) -> dict:
+    """
+    [Description]
+
+        Runs one stage of the pipeline, measuring it.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Running the stage on its own cursor with duckdb profiling enabled, and returning:
+
+            duracao_s:                     wall time of the stage.
+            pico_rss_mb:                   peak RSS of the process sampled while the stage ran (every INTERVALO_RSS),
+                                           which includes the stages running in parallel, but not the worker processes.
+            perfil:                        the duckdb profiling output of the last query of the stage, if any.
+            linhas_entrada:                rows of the .parquet inputs of the stage (none for .csv inputs).
+            linhas_lidas_ultima_consulta:  rows read by the scans of the last query of the stage (e.g. the .csv scan of ETLSIH).
+            linhas_saida:                  rows of the .parquet outputs of the stage.
+
+    """
+
+    arquivo_perfil = f"""{LOG_PATH}perfil_{etapa.nome}.json"""
+
+    # A profile left by an earlier run would be taken for a query of this one (e.g. a cached analise).
+    if os.path.exists(arquivo_perfil):
+        os.remove(arquivo_perfil)
+
+    conn.execute("PRAGMA enable_profiling = 'json'")
+    conn.execute(f"SET profiling_output = '{arquivo_perfil}'")
+
+    pico = [rss_atual()]
+    fim = threading.Event()
+
+    def amostrar():
+        while not fim.wait(INTERVALO_RSS):
+            pico[0] = max(pico[0], rss_atual())
+
+    amostrador = threading.Thread(target=amostrar, daemon=True)
+    amostrador.start()
+
+    inicio = time.perf_counter()
+
+    try:
+        etapa.funcao(conn, escopo)
+    finally:
+        fim.set()
+        amostrador.join()
+
+    duracao = time.perf_counter() - inicio
+
+    conn.execute("PRAGMA disable_profiling")
+
+    gravar_carimbo_etapa(etapa, escopo)
+
+    medicao = {
+        "nome": etapa.nome,
+        "situacao": "executada",
+        "duracao_s": round(duracao, 3),
+        "pico_rss_mb": round(max(pico[0], rss_atual()), 1),
+        "perfil": None,
+        "linhas_entrada": None,
+        "linhas_lidas_ultima_consulta": None,
+        "linhas_saida": None,
+    }
+
+    if os.path.exists(arquivo_perfil):
+        medicao["perfil"] = arquivo_perfil
+
+        with open(arquivo_perfil, encoding="utf-8") as arquivo:
+            medicao["linhas_lidas_ultima_consulta"] = linhas_lidas(json.load(arquivo))
+
+    # Row counts of .parquet files come from their metadata, without reading the rows.
+    for campo, padroes in (("linhas_entrada", etapa.entradas), ("linhas_saida", etapa.saidas)):
+        arquivos = [caminho for padrao in padroes for caminho in glob.glob(padrao) if caminho.endswith(".parquet")]
+
+        if arquivos:
+            lista_arquivos = ", ".join(f"'{caminho}'" for caminho in arquivos)
+            medicao[campo] = conn.execute(f"SELECT count(*) FROM read_parquet([{lista_arquivos}], union_by_name = true)").fetchone()[0]
+
+    return medicao
+
+def executar_pipeline(conn, escopo, etapas, forcar=False) -> dict:
+    """
+    [Description]
+
+        Runs the pipeline.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Running the stages in dependency order, independent stages in parallel (NUMERO_THREADS workers),
+        skipping stages whose outputs are up to date for the scope, and writing a json run report to LOG_PATH with the
+        measures of each stage (see executar_etapa).
+
+    """
+
+    os.makedirs(LOG_PATH, exist_ok=True)
+
+    # Stages running in parallel write to these directories.
+    os.makedirs(SILVER_PATH, exist_ok=True)
+    os.makedirs(GOLD_PATH, exist_ok=True)
+
+    relatorio = {"inicio": datetime.now().isoformat(timespec="seconds"), "etapas": []}
+    inicio = time.perf_counter()
+
+    pendentes = {etapa.nome: etapa for etapa in etapas}
+    concluidas = set()
+    falhas = set()
+    em_execucao = {}
+
+    with ThreadPoolExecutor(max_workers=NUMERO_THREADS) as executor:
+
+        while pendentes or em_execucao:
+
+            andamento = len(pendentes)
+
+            for nome, etapa in list(pendentes.items()):
+
+                # Stages depending on a failed stage are not run.
+                if any(dependencia in falhas for dependencia in etapa.dependencias):
+                    relatorio["etapas"].append({"nome": nome, "situacao": "ignorada"})
+                    falhas.add(nome)
+                    del pendentes[nome]
+
+                elif all(dependencia in concluidas for dependencia in etapa.dependencias):
+                    del pendentes[nome]
+
+                    if not forcar and etapa_atualizada(etapa, escopo):
+                        print(f"Pipeline: {nome} is up to date")
+                        relatorio["etapas"].append({"nome": nome, "situacao": "atualizada"})
+                        concluidas.add(nome)
+                        continue
+
+                    print(f"Pipeline: running {nome}")
+                    em_execucao[executor.submit(executar_etapa, conn.cursor(), escopo, etapa)] = nome
+
+            if not em_execucao:
+
+                # Nothing running and nothing could start: dependencies that do not exist.
+                if len(pendentes) == andamento:
+                    raise ValueError(f"Stages with unknown dependencies: {sorted(pendentes)}")
+
+                continue
+
+            finalizadas, _ = wait(em_execucao, return_when=FIRST_COMPLETED)
+
+            for tarefa in finalizadas:
+                nome = em_execucao.pop(tarefa)
+
+                try:
+                    relatorio["etapas"].append(tarefa.result())
+                    concluidas.add(nome)
+                except Exception as e:
+                    print(f"Error: stage {nome} failed: {e}")
+                    relatorio["etapas"].append({"nome": nome, "situacao": "falhou", "erro": str(e)})
+                    falhas.add(nome)
+
+    relatorio["duracao_s"] = round(time.perf_counter() - inicio, 3)
+
+    with open(f"""{LOG_PATH}execucao_{relatorio['inicio'].replace(':', '')}.json""", "w", encoding="utf-8") as arquivo:
+        json.dump(relatorio, arquivo, indent=2)
+
+    return relatorio
+
+def argumentos_comuns(parser, padroes=True) -> None:
+    """
+    [Description]
+
+        Adds the options shared by the commands of the command line.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Accepting the scope and runtime options after the command (e.g. analyse sih_frota --ufs SP).
+        Options are also accepted before the command, except the lists (--ufs, --municipios), which would
+        take the command as one of their values. In the command parsers (padroes=False) the options have
+        no default, so they do not override the values given before the command.
+
+    """
+
+    def padrao(valor):
+        return valor if padroes else argparse.SUPPRESS
+
+    parser.add_argument("--escopo", default=padrao(None), help=".json file with the scope (ufs, municipios, ano_inicial, ano_final)")
+    parser.add_argument("--ufs", nargs="*", type=str.upper, choices=list(CODIGOS_UF), default=padrao(None), metavar="UF", help="states to analyze, e.g. DF RJ SP")
+    parser.add_argument("--municipios", nargs="*", type=int, default=padrao(None), help="IBGE codes (7 digits), none for every municipality of the states")
+    parser.add_argument("--ano-inicial", type=int, default=padrao(None), help="initial year of the SIH data")
+    parser.add_argument("--ano-final", type=int, default=padrao(None), help="final year of the SIH data")
+    parser.add_argument("--catalogo", default=padrao(None), help="duckdb database file keeping the silver layer between runs, e.g. silver/datathon.duckdb")
+    parser.add_argument("--forcar", action="store_true", default=padrao(False), help="run every stage, even if its outputs are up to date")
+    parser.add_argument("--limite-memoria", default=padrao(LIMITE_MEMORIA), help="memory limit of duckdb, e.g. 2GB")
+    parser.add_argument("--threads", type=int, default=padrao(NUMERO_THREADS), help="threads of duckdb")
+    parser.add_argument("--baixar", action="store_true", default=padrao(False), help="download and extract the Fiocruz archives before reading them")
+    parser.add_argument("--descartar-arquivos", action="store_true", default=padrao(False), help="with --baixar, delete each archive once extracted (downloaded again only when it changes)")
+    parser.add_argument("--url-base", default=padrao(URL_BASE), help="base URL of the archives, e.g. a mirror or http://localhost:8000/")
+    parser.add_argument("--nacional", action="store_true", default=padrao(False), help="every state, SIH files read by a pool of processes")
+    parser.add_argument("--processos", type=int, default=padrao(NUMERO_PROCESSOS), help="worker processes of the national mode")
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description="Datathon - traffic accidents, fleet and hospitalizations analysis.",
+        epilog="Without a command, the whole pipeline runs (ingestion and every report). "
+               "Give the options after the command, e.g. ingest simu --ufs DF RJ SP.",
+    )
+    argumentos_comuns(parser)
+
+    comandos = parser.add_subparsers(dest="comando")
+
+    ingestao = comandos.add_parser("ingest", help="ingest one source into the silver layer")
+    ingestao.add_argument("fonte", choices=list(GRUPOS_ETAPAS))
+    argumentos_comuns(ingestao, padroes=False)
+
+    analise_relatorios = comandos.add_parser("analyse", help="run reports over the silver and gold layers, without ingesting")
+    analise_relatorios.add_argument("relatorios", nargs="*", metavar="relatorio", help=f"reports to run ({', '.join(RELATORIOS)}), all by default")
+    analise_relatorios.add_argument("--sem-cache", action="store_true", help="run the reports even if cached")
+    argumentos_comuns(analise_relatorios, padroes=False)
+
+    argumentos = parser.parse_args()
+
+    # Checked here, choices would reject the empty list of nargs="*" (every report).
+    if argumentos.comando == "analyse":
+        desconhecidos = [nome for nome in argumentos.relatorios if nome not in RELATORIOS]
+
+        if desconhecidos:
+            analise_relatorios.error(f"unknown reports: {' '.join(desconhecidos)} (choose from {', '.join(RELATORIOS)})")
+
+    URL_BASE = argumentos.url_base
+    LIMITE_MEMORIA = argumentos.limite_memoria
+    NUMERO_THREADS = argumentos.threads
+
+    try:
+        escopo = ler_escopo(argumentos)
+    except ValueError as e:
+        parser.error(str(e))
 
-    conn = duckdb.connect(':memory:')
+    conn = duckdb.connect(argumentos.catalogo or ':memory:')
 
-    print(ler_acidentes_IPEA(conn))
+    configurar_conexao(conn, argumentos.limite_memoria, argumentos.threads)
 
-    ler_acidentes(conn)
+    escopo.registrar(conn)
 
-    ler_carteira(conn)
+    if argumentos.comando == "analyse":
+        try:
+            analise(conn, escopo, cache=not argumentos.sem_cache, relatorios=argumentos.relatorios)
+        except RuntimeError as e:
+            parser.exit(1, f"Error: {e}\n")
 
-    ler_frotas(conn)
+    else:
+        etapas = etapas_pipeline(escopo, argumentos.baixar, argumentos.processos if argumentos.nacional else None, argumentos.forcar, argumentos.descartar_arquivos)
 
-    analise(conn)
+        if argumentos.comando == "ingest":
+            etapas = selecionar_etapas(etapas, GRUPOS_ETAPAS[argumentos.fonte])
 
-    
\ No newline at end of file
+        executar_pipeline(conn, escopo, etapas, forcar=argumentos.forcar)
@@ -0,0 +1,239 @@
+"""
+
+Benchmarks of the pipeline over the synthetic data of gerar_dados.py.
+
+Each step runs in a fresh process, so its peak memory (max RSS) is not inherited from the previous steps,
+and the results are compared with the baselines of baseline.json.
+
+    python benchmark/executar.py                          # every scale except brasil
+    python benchmark/executar.py --escalas brasil
+    python benchmark/executar.py --atualizar-baseline     # records the results as the new baselines
+
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import time
+
+import duckdb
+
+from gerar_dados import CAPITAIS, ESCALAS, gerar_dados
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+PIPELINE = os.path.join(os.path.dirname(DIRETORIO), "__main__.py")
+DADOS_PATH = os.path.join(DIRETORIO, "dados", "")
+BASELINE = os.path.join(DIRETORIO, "baseline.json")
+
+# Steps measured, in execution order (each one reads what the previous ones wrote).
+# The second ler_etlsih_file measures an incremental run with nothing to ingest.
+ETAPAS = [
+    ("ler_etlsih_file", lambda pipeline, conn, escopo: pipeline.ler_etlsih_file(conn, escopo)),
+    ("ler_etlsih_file_incremental", lambda pipeline, conn, escopo: pipeline.ler_etlsih_file(conn, escopo)),
+    ("ler_acidentes_IPEA", lambda pipeline, conn, escopo: pipeline.ler_acidentes_IPEA(conn, escopo)),
+    ("ler_acidentes", lambda pipeline, conn, escopo: pipeline.ler_acidentes(conn, escopo)),
+    ("ler_carteira", lambda pipeline, conn, escopo: pipeline.ler_carteira(conn, escopo)),
+    ("ler_frotas", lambda pipeline, conn, escopo: pipeline.ler_frotas(conn, escopo)),
+    ("gerar_dim_municipio", lambda pipeline, conn, escopo: pipeline.gerar_dim_municipio(conn)),
+    ("analise", lambda pipeline, conn, escopo: pipeline.analise(conn)),
+]
+
+# Regression thresholds: a result fails when above baseline * TOLERANCIA + FOLGA.
+TOLERANCIA_TEMPO = 1.5
+FOLGA_TEMPO_S = 0.5
+TOLERANCIA_MEMORIA = 1.25
+FOLGA_MEMORIA_MB = 50
+
+def carregar_pipeline(escala):
+    """
+    [Description]
+
+        Loads the pipeline (__main__.py) as a module.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Pointing the raw, silver, gold and logs paths (and the caches inside them) of the pipeline to the directories of the scale.
+
+    """
+
+    especificacao = importlib.util.spec_from_file_location("datathon", PIPELINE)
+    pipeline = importlib.util.module_from_spec(especificacao)
+    especificacao.loader.exec_module(pipeline)
+
+    for nome, pasta in (("RAW_PATH", "raw"), ("SILVER_PATH", "silver"), ("GOLD_PATH", "gold"), ("LOG_PATH", "logs")):
+        caminho = os.path.join(DADOS_PATH, escala, pasta, "")
+        os.makedirs(caminho, exist_ok=True)
+        setattr(pipeline, nome, caminho)
+
+    pipeline.CACHE_PATH = os.path.join(pipeline.RAW_PATH, ".cache", "")
+    pipeline.CACHE_RELATORIOS_PATH = os.path.join(pipeline.GOLD_PATH, ".relatorios", "")
+
+    return pipeline
+
+def escopo_escala(pipeline, escala):
+    # The capitals scale analyzes the 3 capitals, the others every municipality of their states.
+    municipios = [codigo for codigo, _, _ in CAPITAIS] if ESCALAS[escala]["municipios"] is None else []
+
+    return pipeline.Escopo(ufs=list(ESCALAS[escala]["ufs"]), municipios=municipios)
+
+def medir_etapa(escala, indice, fila) -> None:
+    """
+    [Description]
+
+        Runs one step of the benchmark.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Measuring the wall time and the peak memory (max RSS, which includes the memory of duckdb) of the step,
+        in a process started only for it. The output of the step is discarded.
+
+    """
+
+    pipeline = carregar_pipeline(escala)
+    escopo = escopo_escala(pipeline, escala)
+
+    conn = duckdb.connect()
+    conn.execute("SET enable_progress_bar = false")
+    pipeline.configurar_conexao(conn)
+    escopo.registrar(conn)
+
+    nome, funcao = ETAPAS[indice]
+
+    inicio = time.perf_counter()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        funcao(pipeline, conn, escopo)
+
+    duracao = time.perf_counter() - inicio
+
+    # ru_maxrss is in kilobytes on linux and in bytes on macOS.
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+
+    fila.put({"tempo_s": round(duracao, 3), "pico_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor, 1)})
+
+def executar_escala(escala, regerar=False) -> dict:
+    """
+    [Description]
+
+        Runs the benchmark of a scale.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Generating the synthetic data once (kept in benchmark/dados/{escala}/raw), cleaning the silver and gold layers,
+        and measuring each step of ETAPAS from scratch.
+
+    """
+
+    raw = os.path.join(DADOS_PATH, escala, "raw", "")
+
+    if regerar or not os.path.isdir(raw):
+        shutil.rmtree(raw, ignore_errors=True)
+        print(f"Generating data: {escala}")
+        inicio = time.perf_counter()
+        gerar_dados(escala, raw)
+        print(f"  {time.perf_counter() - inicio:.1f}s")
+
+    for pasta in ("silver", "gold", "logs"):
+        shutil.rmtree(os.path.join(DADOS_PATH, escala, pasta), ignore_errors=True)
+
+    # spawn starts every step from a clean interpreter.
+    contexto = multiprocessing.get_context("spawn")
+    resultados = {}
+
+    for indice, (nome, _) in enumerate(ETAPAS):
+        fila = contexto.Queue()
+        processo = contexto.Process(target=medir_etapa, args=(escala, indice, fila))
+        processo.start()
+        processo.join()
+
+        if processo.exitcode != 0:
+            raise RuntimeError(f"Step {nome} of the scale {escala} failed (exit code {processo.exitcode})")
+
+        resultados[nome] = fila.get()
+        print(f"  {escala:<9} {nome:<28} {resultados[nome]['tempo_s']:>8.3f}s {resultados[nome]['pico_rss_mb']:>8.1f}MB")
+
+    return resultados
+
+def comparar(resultados, baseline) -> list:
+    """
+    [Description]
+
+        Compares the results with the baselines.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Listing the steps slower or heavier than their baseline, beyond the tolerances.
+
+    """
+
+    regressoes = []
+
+    for escala, etapas in resultados.items():
+        for nome, medida in etapas.items():
+            referencia = baseline.get("escalas", {}).get(escala, {}).get(nome)
+
+            if referencia is None:
+                continue
+
+            if medida["tempo_s"] > referencia["tempo_s"] * TOLERANCIA_TEMPO + FOLGA_TEMPO_S:
+                regressoes.append(f"{escala}/{nome}: time {medida['tempo_s']}s (baseline {referencia['tempo_s']}s)")
+
+            if medida["pico_rss_mb"] > referencia["pico_rss_mb"] * TOLERANCIA_MEMORIA + FOLGA_MEMORIA_MB:
+                regressoes.append(f"{escala}/{nome}: memory {medida['pico_rss_mb']}MB (baseline {referencia['pico_rss_mb']}MB)")
+
+    return regressoes
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Benchmarks of the pipeline over synthetic data.")
+    parser.add_argument("--escalas", nargs="*", choices=list(ESCALAS), default=["capitais", "estado"])
+    parser.add_argument("--regerar", action="store_true", help="generate the synthetic data again")
+    parser.add_argument("--atualizar-baseline", action="store_true", help="record the results in baseline.json")
+    argumentos = parser.parse_args()
+
+    resultados = {escala: executar_escala(escala, argumentos.regerar) for escala in argumentos.escalas}
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE, encoding="utf-8") as arquivo:
+            baseline = json.load(arquivo)
+
+    if argumentos.atualizar_baseline:
+        baseline["maquina"] = {"sistema": platform.platform(), "processadores": os.cpu_count(), "duckdb": duckdb.__version__}
+        baseline.setdefault("escalas", {}).update(resultados)
+
+        with open(BASELINE, "w", encoding="utf-8") as arquivo:
+            json.dump(baseline, arquivo, indent=2, ensure_ascii=False)
+
+        print(f"Baselines written to {BASELINE}")
+        sys.exit(0)
+
+    regressoes = comparar(resultados, baseline)
+
+    for regressao in regressoes:
+        print(f"Regression: {regressao}")
+
+    sys.exit(1 if regressoes else 0)
@@ -0,0 +1,279 @@
+"""
+
+Synthetic data generators for the benchmarks.
+
+Writes files with the same names and layout as the real inputs (raw/ETLSIH/ETLSIH.ST_{UF}_{ano}_{mes}_t.csv,
+the SIMU .csv files and the 12 IPEA series), filled with random records generated by duckdb,
+so the pipeline can be measured without downloading the Fiocruz/IPEA archives.
+
+"""
+import argparse
+import os
+
+import duckdb
+
+# IBGE code of each brazilian state.
+CODIGOS_UF = {
+    "RO": 11, "AC": 12, "AM": 13, "RR": 14, "PA": 15, "AP": 16, "TO": 17,
+    "MA": 21, "PI": 22, "CE": 23, "RN": 24, "PB": 25, "PE": 26, "AL": 27, "SE": 28, "BA": 29,
+    "MG": 31, "ES": 32, "RJ": 33, "SP": 35,
+    "PR": 41, "SC": 42, "RS": 43,
+    "MS": 50, "MT": 51, "GO": 52, "DF": 53,
+}
+
+# Capitals analyzed by the project (IBGE code, name, state).
+CAPITAIS = [(3304557, "Rio de Janeiro", "RJ"), (5300108, "Brasília", "DF"), (3550308, "São Paulo", "SP")]
+
+"""
+
+Scales of the synthetic data.
+
+    municipios: number of municipalities per state (None for only the capitals).
+    registros:  records per monthly ETLSIH file.
+
+"""
+ESCALAS = {
+    "capitais": {"ufs": ["DF", "RJ", "SP"], "municipios": None, "anos": (2015, 2021), "registros": 500},
+    "estado": {"ufs": ["SP"], "municipios": 645, "anos": (2015, 2021), "registros": 5000},
+    "brasil": {"ufs": list(CODIGOS_UF), "municipios": 206, "anos": (2015, 2021), "registros": 2000},
+}
+
+# IPEA series (file name without .csv).
+SERIES_IPEA = [
+    "bitos-em-acidentes-de-transporte",
+    "bitos-em-acidentes-de-transporte-mulheres",
+    "bitos-em-acidentes-de-transporte-homens",
+    "bitos-em-acidentes-de-transporte-de-jovens",
+    "bitos-em-acidentes-de-transporte-de-jovens-homens",
+    "bitos-em-acidentes-de-transporte-de-jovens-mulheres",
+    "taxa-de-obitos-em-acidentes-de-transporte",
+    "taxa-de-obitos-em-acidentes-de-transporte-mulheres",
+    "taxa-de-obitos-em-acidentes-de-transporte-homens",
+    "taxa-de-obitos-em-acidentes-de-transporte-de-jovens",
+    "taxa-de-obitos-em-acidentes-de-transporte-de-jovens-homens",
+    "taxa-de-obitos-em-acidentes-de-transporte-de-jovens-mulheres",
+]
+
+def registrar_municipios(conn, escala) -> None:
+    """
+    [Description]
+
+        Creates the table of municipalities of a scale.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Listing the municipalities used by every generator: the real capitals, plus synthetic IBGE codes
+        ({UF}{sequence}{check digit}) when the scale has more municipalities per state.
+
+    """
+
+    municipios = [
+        (codigo, nome, uf) for codigo, nome, uf in CAPITAIS if uf in ESCALAS[escala]["ufs"]
+    ]
+
+    if ESCALAS[escala]["municipios"]:
+        for uf in ESCALAS[escala]["ufs"]:
+            for sequencia in range(1, ESCALAS[escala]["municipios"] + 1):
+                codigo = CODIGOS_UF[uf] * 100000 + sequencia * 10 + sequencia % 10
+                municipios.append((codigo, f"Município {uf} {sequencia}", uf))
+
+    conn.execute("CREATE OR REPLACE TABLE municipios (cod_ibge INTEGER, nome VARCHAR, uf VARCHAR, indice INTEGER)")
+    conn.executemany(
+        "INSERT INTO municipios VALUES (?, ?, ?, ?)",
+        [(codigo, nome, uf, indice) for indice, (codigo, nome, uf) in enumerate(municipios)],
+    )
+
+def gerar_etlsih(conn, escala, destino) -> None:
+    """
+    [Description]
+
+        Generates the monthly ETLSIH files.
+
+    [Source]
+
+        Link: https://bigdata-arquivos.icict.fiocruz.br/PUBLICO/SIH/ETLSIH.zip
+
+    [Goal]
+
+        Writing one ETLSIH.ST_{UF}_{ano}_{mes}_t.csv per state and month, with the fields of the real extract.
+        About 60% of the records have a traffic accident (V01-V89) as secondary diagnosis.
+
+    """
+
+    os.makedirs(f"{destino}ETLSIH", exist_ok=True)
+
+    inicio, fim = ESCALAS[escala]["anos"]
+
+    for uf in ESCALAS[escala]["ufs"]:
+
+        conn.execute("CREATE OR REPLACE TEMP TABLE municipios_uf AS SELECT *, row_number() OVER () - 1 AS posicao FROM municipios WHERE uf = ?", [uf])
+        quantidade = conn.execute("SELECT count(*) FROM municipios_uf").fetchone()[0]
+
+        for ano in range(inicio, fim + 1):
+            for mes in range(1, 13):
+                conn.execute(f"""COPY (
+                    SELECT m.cod_ibge // 10 AS int_MUNCOD,
+                           m.nome AS int_MUNNOME,
+                           {ano} AS ANO_CMPT,
+                           '{mes:02d}' AS MES_CMPT,
+                           CASE WHEN random() < 0.7 THEN 'Masculino' ELSE 'Feminino' END AS def_sexo,
+                           round(random() * 5000, 2) AS VAL_SH,
+                           round(random() * 1000, 2) AS VAL_SP,
+                           round(random() * 6000, 2) AS VAL_TOT,
+                           CASE WHEN random() < 0.1 THEN round(random() * 10000, 2) ELSE 0 END AS VAL_UTI,
+                           'S' || lpad(CAST(floor(random() * 100) AS INTEGER)::VARCHAR, 2, '0') || '2' AS DIAG_PRINC,
+                           CAST(floor(random() * 90) AS INTEGER) AS IDADE,
+                           '99' AS RACA_COR,
+                           CASE WHEN m.indice < 3 THEN 'S' ELSE 'N' END AS int_CAPITAL,
+                           m.uf AS int_SIGLA_UF,
+                           {CODIGOS_UF[uf]} AS int_CODIGO_UF,
+                           'Região' AS int_REGIAO,
+                           m.uf AS int_NOME_UF,
+                           ['dom', 'seg', 'ter', 'qua', 'qui', 'sex', 'sab'][1 + CAST(floor(random() * 7) AS INTEGER)] AS dia_semana_internacao,
+                           {ano} AS ano_internacao,
+                           {mes} AS mes_internacao,
+                           'PROCEDIMENTO ' || CAST(floor(random() * 50) AS INTEGER) AS def_procedimento_realizado,
+                           'PROCEDIMENTO ' || CAST(floor(random() * 50) AS INTEGER) AS def_procedimento_solicitado,
+                           CASE WHEN random() < 0.6 THEN 'Cirúrgico' ELSE 'Clínico' END AS def_leitos,
+                           'XIX. Lesões enven e alg out conseq causas externas' AS def_diag_princ_cap,
+                           'Traumatismos' AS def_diag_princ_grupo,
+                           NULL AS def_diag_secun_grupo,
+                           'S06 Traum intracraniano' AS def_diag_princ_cat,
+                           NULL AS def_diag_secun_cat,
+                           'S06.2 Traum cerebral difuso' AS def_diag_princ_subcat,
+                           CASE WHEN random() < 0.8 THEN 'Urgência' ELSE 'Eletivo' END AS def_car_int,
+                           'Alta melhorado' AS def_cobranca,
+                           CASE WHEN random() < 0.05 THEN 'Com óbito' ELSE 'Sem óbito' END AS def_morte,
+                           'Sem informação' AS def_raca_cor,
+                           ['0-14 anos', '15-24 anos', '25-34 anos', '35-44 anos', '45-59 anos', '60+ anos'][1 + CAST(floor(random() * 6) AS INTEGER)] AS def_idade_pub,
+                           CASE WHEN random() < 0.6
+                                THEN 'V' || lpad(CAST(1 + floor(random() * 89) AS INTEGER)::VARCHAR, 2, '0')
+                                ELSE ['W', 'X', 'Y', 'S'][1 + CAST(floor(random() * 4) AS INTEGER)] || lpad(CAST(floor(random() * 100) AS INTEGER)::VARCHAR, 2, '0')
+                           END || CAST(floor(random() * 10) AS INTEGER) AS DIAGSEC1
+                    FROM range({ESCALAS[escala]["registros"]}) r
+                    JOIN municipios_uf m ON m.posicao = (r.range * 7919) % {quantidade}
+                ) TO '{destino}ETLSIH/ETLSIH.ST_{uf}_{ano}_{mes}_t.csv' (HEADER)""")
+
+def gerar_simu(conn, destino) -> None:
+    """
+    [Description]
+
+        Generates the SIMU files - Evolutionary Fleet, Enterprise Portfolio and Transport Accidents.
+
+    [Source]
+
+        Link: https://bigdata-arquivos.icict.fiocruz.br/PUBLICO/SIMU/
+
+    [Goal]
+
+        Writing simu-frota-mun_T.csv, simu-carteira-mun-T.csv and SIMU - Acidentes de Transportes/Acidentes de Transportes.csv
+        with one record per municipality and year (2010-2021), and about one work per municipality and year in the portfolio.
+
+    """
+
+    os.makedirs(f"{destino}SIMU - Acidentes de Transportes", exist_ok=True)
+
+    conn.execute(f"""COPY (
+        SELECT m.cod_ibge AS "Código IBGE",
+               m.nome AS "Município",
+               a.ano,
+               floor(100000 + random() * 2000000) AS TOTAL_VEICULOS,
+               floor(50000 + random() * 1500000) AS AUTOMOVEL,
+               floor(10000 + random() * 200000) AS MOTOCICLETA,
+               floor(1000000 + random() * 10000000 + a.ano * 1000) AS Populacao,
+               m.uf AS uf_SIGLA_UF
+        FROM municipios m, range(2010, 2022) a(ano)
+    ) TO '{destino}simu-frota-mun_T.csv' (HEADER)""")
+
+    conn.execute(f"""COPY (
+        SELECT '1-' || row_number() OVER () AS cod_mdr,
+               CAST(m.cod_ibge AS DOUBLE) AS "Código IBGE",
+               'EMPREENDIMENTO ' || row_number() OVER () AS empreendimento,
+               round(random() * 100000000, 2) AS vlr_investimento,
+               CASE WHEN random() < 0.8 THEN CAST(a.ano AS DOUBLE) END AS ano_fim_obra,
+               m.uf AS uf_SIGLA_UF
+        FROM municipios m, range(2010, 2022) a(ano)
+    ) TO '{destino}simu-carteira-mun-T.csv' (HEADER)""")
+
+    conn.execute(f"""COPY (
+        SELECT m.cod_ibge AS "Código IBGE",
+               a.ano,
+               'SE' AS "Região",
+               m.nome AS "Município",
+               floor(random() * 1500) AS total_mortes,
+               floor(random() * 12000) AS total_feridos,
+               floor(1000000 + random() * 10000000) AS Populacao,
+               m.uf AS uf_SIGLA_UF
+        FROM municipios m, range(2010, 2022) a(ano)
+    ) TO '{destino}SIMU - Acidentes de Transportes/Acidentes de Transportes.csv' (HEADER)""")
+
+def gerar_ipea(conn, destino) -> None:
+    """
+    [Description]
+
+        Generates the 12 IPEA series.
+
+    [Source]
+
+        Link: https://www.ipea.gov.br/atlasviolencia/filtros-series/12/violencia-no-transito
+
+    [Goal]
+
+        Writing one {serie}.csv per series (cod;nome;período;valor), per municipality and year (2005-2021).
+
+    """
+
+    os.makedirs(f"{destino}IPEA", exist_ok=True)
+
+    for serie in SERIES_IPEA:
+        valor = "round(random() * 40, 2)" if serie.startswith("taxa") else "CAST(floor(random() * 1500) AS INTEGER)"
+
+        conn.execute(f"""COPY (
+            SELECT m.cod_ibge AS cod, m.nome, a.ano AS "período", {valor} AS valor
+            FROM municipios m, range(2005, 2022) a(ano)
+        ) TO '{destino}IPEA/{serie}.csv' (HEADER, DELIMITER ';')""")
+
+def gerar_dados(escala, destino) -> None:
+    """
+    [Description]
+
+        Generates every input of the pipeline for a scale.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Writing the synthetic raw layer of the scale in destino, with a fixed seed so runs are reproducible.
+
+    """
+
+    conn = duckdb.connect()
+
+    # A single thread keeps the random sequence reproducible.
+    conn.execute("SET threads = 1")
+    conn.execute("SELECT setseed(0.42)")
+
+    registrar_municipios(conn, escala)
+
+    gerar_etlsih(conn, escala, destino)
+
+    gerar_simu(conn, destino)
+
+    gerar_ipea(conn, destino)
+
+    conn.close()
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Generates synthetic inputs of the pipeline.")
+    parser.add_argument("escala", choices=list(ESCALAS))
+    parser.add_argument("destino", help="raw directory to write, e.g. benchmark/dados/capitais/raw/")
+    argumentos = parser.parse_args()
+
+    gerar_dados(argumentos.escala, os.path.join(argumentos.destino, ""))
@@ -0,0 +1,315 @@
+"""
+
+Check of the downloads of the pipeline (baixar_arquivo and extrair_membros) against a local HTTP server.
+
+The server stands in for the Fiocruz site, serving a synthetic .zip with or without range requests,
+so the plain and ranged downloads, the resume of an interrupted download, the replacement of a new
+version of the archive, the offline fallback, the extraction and the deletion of the archive once
+extracted are checked without network access.
+
+    python -m pytest tests
+    python tests/test_download.py
+
+"""
+import hashlib
+import http.server
+import importlib.util
+import io
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import zipfile
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+PIPELINE = os.path.join(os.path.dirname(DIRETORIO), "__main__.py")
+
+# Members of the synthetic archive: two months of DF in the scope and one of MG outside it.
+MEMBROS = ["ETLSIH.ST_DF_2015_1_t.csv", "ETLSIH.ST_DF_2015_2_t.csv", "ETLSIH.ST_MG_2015_1_t.csv"]
+
+class Servidor(http.server.ThreadingHTTPServer):
+    """
+    [Description]
+
+        Local HTTP server of one archive.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Answering HEAD and GET requests with the archive, its ETag and, with intervalos, range requests (206),
+        counting the bytes sent. With interromper, the first GET is cut after half of its bytes.
+
+    """
+
+    def __init__(self, conteudo, intervalos):
+        super().__init__(("127.0.0.1", 0), Requisicao)
+        self.intervalos = intervalos
+        self.interromper = False
+        self.enviados = 0
+        self.trava = threading.Lock()
+        self.publicar(conteudo)
+
+    def publicar(self, conteudo):
+        self.conteudo = conteudo
+        self.etag = f'"{hashlib.sha256(conteudo).hexdigest()[:16]}"'
+
+class Requisicao(http.server.BaseHTTPRequestHandler):
+
+    def log_message(self, *argumentos):
+        pass
+
+    def cabecalhos(self, codigo, tamanho, intervalo=None):
+        self.send_response(codigo)
+        self.send_header("Content-Length", str(tamanho))
+        self.send_header("ETag", self.server.etag)
+
+        if self.server.intervalos:
+            self.send_header("Accept-Ranges", "bytes")
+
+        if intervalo is not None:
+            self.send_header("Content-Range", f"bytes {intervalo[0]}-{intervalo[1]}/{len(self.server.conteudo)}")
+
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.cabecalhos(200, len(self.server.conteudo))
+
+    def do_GET(self):
+        conteudo = self.server.conteudo
+        correspondencia = re.fullmatch(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+
+        if self.server.intervalos and correspondencia is not None:
+            inicio, fim = int(correspondencia.group(1)), min(int(correspondencia.group(2)), len(conteudo) - 1)
+            corpo = conteudo[inicio:fim + 1]
+            self.cabecalhos(206, len(corpo), (inicio, fim))
+        else:
+            corpo = conteudo
+            self.cabecalhos(200, len(corpo))
+
+        with self.server.trava:
+            interromper, self.server.interromper = self.server.interromper, False
+
+        if interromper:
+            corpo = corpo[:len(corpo) // 2]
+
+        self.wfile.write(corpo)
+
+        with self.server.trava:
+            self.server.enviados += len(corpo)
+
+        if interromper:
+            self.close_connection = True
+
+def gerar_arquivo(semente) -> bytes:
+    # Archive of random (incompressible) .csv members, large enough to be split in parts.
+    gerador = random.Random(semente)
+    saida = io.BytesIO()
+
+    with zipfile.ZipFile(saida, "w", zipfile.ZIP_STORED) as arquivo_zip:
+        for membro in MEMBROS:
+            linhas = "\n".join(f"{gerador.getrandbits(64):x};{gerador.getrandbits(64):x}" for _ in range(8000))
+            arquivo_zip.writestr(f"ETLSIH/{membro}", f"a;b\n{linhas}\n")
+
+    return saida.getvalue()
+
+def carregar_pipeline(pasta):
+    # Loads __main__.py as a module with its raw layer and cache in pasta, and parts small enough to split the archive.
+    especificacao = importlib.util.spec_from_file_location("datathon", PIPELINE)
+    pipeline = importlib.util.module_from_spec(especificacao)
+    especificacao.loader.exec_module(pipeline)
+
+    pipeline.RAW_PATH = os.path.join(pasta, "raw", "")
+    pipeline.CACHE_PATH = os.path.join(pasta, "raw", ".cache", "")
+    pipeline.TAMANHO_MINIMO_PARTE = 64 * 1024
+    pipeline.TAMANHO_BLOCO = 16 * 1024
+
+    return pipeline
+
+def verificar(intervalos) -> None:
+    """
+    [Description]
+
+        Checks the downloads against a server with or without range requests.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Asserting that the object in the cache is the archive, that an interrupted download resumes
+        (ranged) or restarts (plain) on the next call, that a new ETag replaces and removes the old object,
+        that the cached copy is used offline and that only the members of the scope are extracted.
+
+    """
+
+    modo = "range" if intervalos else "plain"
+
+    with tempfile.TemporaryDirectory() as pasta:
+        pipeline = carregar_pipeline(pasta)
+
+        conteudo = gerar_arquivo(1)
+        servidor = Servidor(conteudo, intervalos)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{servidor.server_address[1]}/ETLSIH.zip"
+
+        # Interrupted download: the call fails, the next one completes it.
+        servidor.interromper = True
+
+        try:
+            pipeline.baixar_arquivo(url)
+            falhou = False
+        except Exception:
+            falhou = True
+
+        assert falhou, f"{modo}: the interrupted download did not fail"
+
+        caminho = pipeline.baixar_arquivo(url)
+
+        with open(caminho, "rb") as arquivo:
+            assert arquivo.read() == conteudo, f"{modo}: cached object differs from the archive"
+
+        # Ranged parts resume from their bytes on disk, the plain download starts again.
+        if intervalos:
+            assert servidor.enviados < 1.5 * len(conteudo), f"{modo}: {servidor.enviados} bytes sent, the download did not resume"
+        else:
+            assert servidor.enviados >= 1.5 * len(conteudo), f"{modo}: {servidor.enviados} bytes sent for a plain download"
+
+        print(f"{modo}: download of {len(conteudo)} bytes after an interruption, {servidor.enviados} bytes sent")
+
+        # Unchanged ETag: nothing is downloaded.
+        enviados = servidor.enviados
+        assert pipeline.baixar_arquivo(url) == caminho and servidor.enviados == enviados, f"{modo}: unchanged archive downloaded again"
+
+        # New version: new object, the old one is removed.
+        servidor.publicar(gerar_arquivo(2))
+        novo = pipeline.baixar_arquivo(url)
+
+        assert novo != caminho and not os.path.exists(caminho), f"{modo}: old version kept in the cache"
+        assert os.listdir(os.path.join(pipeline.CACHE_PATH, "objetos")) == [os.path.basename(novo)], f"{modo}: extra objects in the cache"
+
+        print(f"{modo}: new version replaces the old object")
+
+        # Offline: the cached copy is used.
+        servidor.shutdown()
+        servidor.server_close()
+
+        assert pipeline.baixar_arquivo(url) == novo, f"{modo}: cached copy not used offline"
+
+        print(f"{modo}: cached copy used offline")
+
+        escopo = pipeline.Escopo(ufs=["DF"], municipios=[], ano_inicial=2015, ano_final=2015)
+        pipeline.URL_BASE = url.rsplit("/", 1)[0] + "/"
+        pipeline.FONTES = {"etlsih": ("ETLSIH.zip", "ETLSIH/", "ETLSIH.ST_*_t.csv")}
+
+        extraidos = sorted(os.path.basename(caminho) for caminho in pipeline.adquirir_fonte("etlsih", escopo))
+
+        assert extraidos == MEMBROS[:2], f"{modo}: extracted {extraidos}"
+
+        print(f"{modo}: extracted {', '.join(extraidos)}")
+
+def verificar_descarte() -> None:
+    """
+    [Description]
+
+        Checks the deletion of the archive once extracted.
+
+    [Source]
+
+        None
+
+    [Goal]
+
+        Asserting that with descartar no object or part is left in the cache after the extraction, that an
+        unchanged archive is not downloaded again (online or offline), that a changed extracted file or a new
+        ETag brings the archive back, and that the members of a wider scope are extracted.
+
+    """
+
+    with tempfile.TemporaryDirectory() as pasta:
+        pipeline = carregar_pipeline(pasta)
+
+        servidor = Servidor(gerar_arquivo(1), True)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{servidor.server_address[1]}/ETLSIH.zip"
+
+        pipeline.URL_BASE = url.rsplit("/", 1)[0] + "/"
+        pipeline.FONTES = {"etlsih": ("ETLSIH.zip", "ETLSIH/", "ETLSIH.ST_*_t.csv")}
+        escopo = pipeline.Escopo(ufs=["DF"], municipios=[], ano_inicial=2015, ano_final=2015)
+
+        def cache():
+            return sorted(
+                os.path.relpath(os.path.join(raiz, arquivo), pipeline.CACHE_PATH)
+                for raiz, _, arquivos in os.walk(pipeline.CACHE_PATH) for arquivo in arquivos
+            )
+
+        extraidos = pipeline.adquirir_fonte("etlsih", escopo, descartar=True)
+
+        assert sorted(os.path.basename(caminho) for caminho in extraidos) == MEMBROS[:2], f"descarte: extracted {extraidos}"
+        assert cache() == ["indice.json"], f"descarte: cache keeps {cache()}"
+
+        # Unchanged archive and extracted files: nothing is downloaded.
+        enviados = servidor.enviados
+        assert sorted(pipeline.adquirir_fonte("etlsih", escopo, descartar=True)) == sorted(extraidos)
+        assert servidor.enviados == enviados, "descarte: unchanged archive downloaded again"
+
+        print("descarte: archive deleted after extraction, not downloaded again")
+
+        # A changed extracted file is extracted again from a new download.
+        with open(extraidos[0], "a") as arquivo:
+            arquivo.write("x\n")
+
+        pipeline.adquirir_fonte("etlsih", escopo, descartar=True)
+
+        assert servidor.enviados > enviados, "descarte: changed extracted file not restored"
+        assert cache() == ["indice.json"], f"descarte: cache keeps {cache()}"
+
+        # A wider scope needs members never extracted.
+        enviados = servidor.enviados
+        escopo_mg = pipeline.Escopo(ufs=["DF", "MG"], municipios=[], ano_inicial=2015, ano_final=2015)
+        extraidos = pipeline.adquirir_fonte("etlsih", escopo_mg, descartar=True)
+
+        assert servidor.enviados > enviados and len(extraidos) == 3, "descarte: wider scope not extracted"
+
+        # A new version is downloaded and extracted.
+        conteudo = gerar_arquivo(2)
+        servidor.publicar(conteudo)
+        pipeline.adquirir_fonte("etlsih", escopo_mg, descartar=True)
+
+        with zipfile.ZipFile(io.BytesIO(conteudo)) as arquivo_zip, open(extraidos[0], "rb") as arquivo:
+            assert arquivo.read() == arquivo_zip.read(f"ETLSIH/{os.path.basename(extraidos[0])}"), "descarte: new version not extracted"
+
+        print("descarte: changed files, wider scope and new version downloaded again")
+
+        # Offline: the extracted files are used.
+        servidor.shutdown()
+        servidor.server_close()
+
+        assert sorted(pipeline.adquirir_fonte("etlsih", escopo_mg, descartar=True)) == sorted(extraidos), "descarte: extracted files not used offline"
+
+        print("descarte: extracted files used offline")
+
+def test_download_plain():
+    verificar(False)
+
+def test_download_range():
+    verificar(True)
+
+def test_descarte():
+    verificar_descarte()
+
+if __name__ == '__main__':
+
+    for intervalos in (False, True):
+        verificar(intervalos)
+
+    verificar_descarte()
+
+    print("Downloads OK")
+
+    sys.exit(0)